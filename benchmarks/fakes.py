@@ -0,0 +1,199 @@
+"""
+Stand-ins for the services the bot talks to, used by benchmarks.suite:
+
+- FakeTelegram answers the Pyrogram calls the bot makes, after a fixed
+  latency, and raises FloodWait on a configurable share of calls.
+- StubServer is a local aiohttp app that serves IMDb-shaped search and title
+  pages, poster images and a shortener /api, with its own latency.
+- RoutingSession wraps a real aiohttp session and sends the bot's IMDb and
+  shortener requests to the stub, so the real scraping and shortening code runs.
+"""
+import asyncio
+import hashlib
+import itertools
+import random
+from collections import Counter
+from types import SimpleNamespace
+from urllib.parse import urlsplit, urlunsplit
+
+import aiohttp
+from aiohttp import web
+from pyrogram.errors import FloodWait, UserNotParticipant
+
+
+class FakeFileMessage:
+    """A channel message carrying a document, as Pyrogram would return it."""
+
+    def __init__(self, telegram, chat_id, message_id, file_name, file_unique_id=None):
+        self.telegram = telegram
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = message_id
+        self.empty = False
+        self.media = SimpleNamespace(value="document")
+        self.document = SimpleNamespace(
+            file_name=file_name, file_size=1024 * 1024,
+            file_unique_id=file_unique_id or hashlib.sha1(f"{chat_id}:{message_id}".encode()).hexdigest()[:16]
+        )
+        self.video = self.audio = None
+
+    async def copy(self, chat_id):
+        await self.telegram.call("copy")
+        copied = FakeFileMessage(self.telegram, chat_id, self.telegram.new_message_id(), self.document.file_name, self.document.file_unique_id)
+        self.telegram.files[copied.id] = (copied.document.file_name, copied.document.file_unique_id)
+        return copied
+
+
+class FakeTelegram:
+    """
+    The Pyrogram client methods the bot uses. Every call sleeps `latency`
+    seconds and then, with probability `flood_rate`, raises FloodWait(flood_seconds).
+    `files` maps Owner DB message IDs to (file_name, file_unique_id) for get_messages.
+    """
+
+    def __init__(self, latency=0.05, flood_rate=0.0, flood_seconds=1, seed=1):
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.floodwaits = 0
+        self.files = {}
+        self.non_members = set()
+        self.message_ids = itertools.count(1_000_000)
+
+    def new_message_id(self):
+        return next(self.message_ids)
+
+    async def call(self, method):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.floodwaits += 1
+            raise FloodWait(value=self.flood_seconds)
+
+    def install(self, client):
+        """Points a Bot (or any namespace used as the client) at this fake."""
+        for name in ("send_message", "send_photo", "copy_message", "get_messages", "edit_message_text",
+                     "get_chat_member", "export_chat_invite_link", "get_chat_invite_link"):
+            setattr(client, name, getattr(self, name))
+        return client
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.call("send_message")
+        return SimpleNamespace(id=self.new_message_id(), chat=SimpleNamespace(id=chat_id), text=text, photo=None)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self.call("send_photo")
+        file_id = photo if not str(photo).startswith("http") else f"photo-{hashlib.sha1(photo.encode()).hexdigest()[:12]}"
+        return SimpleNamespace(id=self.new_message_id(), chat=SimpleNamespace(id=chat_id), photo=SimpleNamespace(file_id=file_id))
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        await self.call("copy_message")
+        return SimpleNamespace(id=self.new_message_id(), chat=SimpleNamespace(id=chat_id))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self.call("edit_message_text")
+
+    async def get_messages(self, chat_id, message_ids):
+        await self.call("get_messages")
+        single = isinstance(message_ids, int)
+        messages = []
+        for message_id in ([message_ids] if single else message_ids):
+            name, unique_id = self.files.get(message_id, (None, None))
+            if name is None:
+                messages.append(SimpleNamespace(id=message_id, empty=True, media=None))
+            else:
+                messages.append(FakeFileMessage(self, chat_id, message_id, name, unique_id))
+        return messages[0] if single else messages
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self.call("get_chat_member")
+        if user_id in self.non_members:
+            raise UserNotParticipant()
+        return SimpleNamespace(status="member")
+
+    async def export_chat_invite_link(self, chat_id):
+        await self.call("export_chat_invite_link")
+        return f"https://t.me/+bench{abs(chat_id)}"
+
+    async def get_chat_invite_link(self, chat_id, invite_link):
+        await self.call("get_chat_invite_link")
+        return SimpleNamespace(invite_link=invite_link, is_revoked=False)
+
+
+class StubServer:
+    """Local HTTP stand-in for IMDb and a URL shortener."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.requests = Counter()
+        self.runner = None
+        self.base_url = None
+
+    async def start(self, host="127.0.0.1"):
+        app = web.Application()
+        app.router.add_get('/find', self.find)
+        app.router.add_get('/title/{title_id}/', self.title)
+        app.router.add_route('*', '/images/{name}', self.image)
+        app.router.add_get('/api', self.shorten)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def _serve(self, kind):
+        self.requests[kind] += 1
+        await asyncio.sleep(self.latency)
+
+    async def find(self, request):
+        await self._serve('imdb_find')
+        title_id = "tt" + hashlib.sha1(request.query.get('q', '').encode()).hexdigest()[:7]
+        html = f'<html><body><a class="ipc-metadata-list-summary-item__t" href="/title/{title_id}/?ref_=fn">Result</a></body></html>'
+        return web.Response(text=html, content_type='text/html')
+
+    async def title(self, request):
+        await self._serve('imdb_title')
+        src = f"{self.base_url}/images/{request.match_info['title_id']}._V1_QL75_UX380_.jpg"
+        html = f'<html><body><div data-testid="hero-media__poster"><img class="ipc-image" src="{src}"></div></body></html>'
+        return web.Response(text=html, content_type='text/html')
+
+    async def image(self, request):
+        await self._serve('image')
+        return web.Response(body=b'\xff\xd8\xff', content_type='image/jpeg')
+
+    async def shorten(self, request):
+        await self._serve('shortener')
+        token = hashlib.sha1(request.query.get('url', '').encode()).hexdigest()[:8]
+        return web.json_response({'status': 'success', 'shortenedUrl': f"https://short.bench/{token}"})
+
+
+class RoutingSession:
+    """An aiohttp session whose IMDb and shortener requests go to a StubServer instead."""
+
+    def __init__(self, stub: StubServer):
+        self.stub = stub
+        self.session = aiohttp.ClientSession()
+
+    def route(self, url):
+        parts = urlsplit(url)
+        if parts.netloc == 'www.imdb.com' or parts.path == '/api':
+            stub = urlsplit(self.stub.base_url)
+            return urlunsplit((stub.scheme, stub.netloc, parts.path, parts.query, ''))
+        return url
+
+    def get(self, url, **kwargs):
+        kwargs.pop('ssl', None)
+        return self.session.get(self.route(url), **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.session.head(self.route(url), **kwargs)
+
+    async def close(self):
+        await self.session.close()
@@ -0,0 +1,65 @@
+"""
+Measures save_file_data throughput against a real mongod, with every file
+written on its own (FILE_WRITE_BATCH_SIZE=1, the old behavior) and through
+the write-behind buffer. Run it on a scratch database; add latency to the
+connection (e.g. point it at a remote mongod) to see the round-trip savings.
+
+    MONGO_URI=mongodb://localhost:27017 DATABASE_NAME=bench python -m benchmarks.file_writes --files 5000 --workers 4
+"""
+import argparse
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from database import db
+from database.write_buffer import BulkWriteBuffer
+
+OWNER_ID = 434343
+
+
+def fake_message(message_id, run):
+    media = SimpleNamespace(file_unique_id=f"bench{run}_{message_id}", file_name=f"Show.S01E{message_id % 99:02d}.720p.mkv", file_size=1024)
+    return SimpleNamespace(id=message_id, chat=SimpleNamespace(id=-1001234), media=SimpleNamespace(value="document"), document=media)
+
+
+async def run(files, workers, batch_size, max_delay, run_id):
+    db.file_writes = BulkWriteBuffer(db.files, batch_size, max_delay)
+    queue = asyncio.Queue()
+    for n in range(files):
+        queue.put_nowait(fake_message(n, run_id))
+    writes = []
+
+    async def worker():
+        while not queue.empty():
+            message = queue.get_nowait()
+            writes.append(await db.save_file_data(OWNER_ID, message, message))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    await db.file_writes.close()
+    results = await asyncio.gather(*writes, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors = sum(isinstance(result, Exception) for result in results)
+    return files / elapsed, db.file_writes.stats['flushes'], errors
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    await db.files.delete_many({'owner_id': OWNER_ID})
+    for run_id, (label, batch_size) in enumerate([("per-file", 1), ("buffered", args.batch_size)]):
+        rate, flushes, errors = await run(args.files, args.workers, batch_size, args.max_delay, run_id)
+        print(f"{label:<10} {rate:9.1f} files/sec  {flushes:>6} round-trips  {errors} errors")
+    await db.files.delete_many({'owner_id': OWNER_ID})
+
+
+if __name__ == "__main__":
+    if db.db.name == 'telegram_bot':
+        sys.exit("Refusing to write to the production database; set DATABASE_NAME to a scratch database.")
+    asyncio.run(main())
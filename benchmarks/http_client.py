@@ -0,0 +1,75 @@
+"""
+Compares request latency with a new aiohttp session per call (the old
+behaviour of fetch_imdb_poster/get_shortlink) against the shared pooled
+session from utils/http.py.
+
+    python -m benchmarks.http_client                      # local stub server
+    python -m benchmarks.http_client --url https://www.imdb.com/ --requests 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+from utils.http import create_http_session
+
+
+async def start_stub_server(port):
+    app = web.Application()
+    app.router.add_get('/', lambda request: web.json_response({"status": "success", "shortenedUrl": "https://short/x"}))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def per_call_session(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            await resp.read()
+
+
+async def measure(label, call, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+    print(f"{label:<18} p50={statistics.median(timings):7.2f} ms  p95={p95:7.2f} ms  mean={statistics.mean(timings):7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="target URL (defaults to a local stub)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    runner = None
+    url = args.url
+    if not url:
+        runner = await start_stub_server(args.port)
+        url = f"http://127.0.0.1:{args.port}/"
+
+    shared = create_http_session()
+
+    async def pooled_call():
+        async with shared.get(url) as resp:
+            await resp.read()
+
+    try:
+        await measure("session per call", lambda: per_call_session(url), args.requests)
+        await measure("shared session", pooled_call, args.requests)
+    finally:
+        await shared.close()
+        if runner:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
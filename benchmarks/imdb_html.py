@@ -0,0 +1,145 @@
+"""
+Checks the targeted extractors in utils/imdb_html.py against the BeautifulSoup
+selectors they replaced, then measures event loop lag while IMDb-sized pages
+are parsed: BeautifulSoup on the loop (the old code), the targeted extractors
+on the loop, and the extractors in the process pool. Exits non-zero if any
+extractor result differs from BeautifulSoup.
+
+    python -m benchmarks.imdb_html --pages 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from config import Config
+from utils import imdb_html
+
+# Markup variations the extractors must agree with BeautifulSoup on
+CASES = [
+    '<a class="ipc-metadata-list-summary-item__t" href="/title/tt1/?ref_=fn">X</a>',
+    "<a href='/title/tt2/' class='ipc-title ipc-metadata-list-summary-item__t'>X</a>",
+    '<A HREF="/title/tt3/?a=1&amp;b=2" CLASS="ipc-metadata-list-summary-item__t">X</A>',
+    '<a class="ipc-metadata-list-summary-item__tc" href="/nope/">X</a><a class="ipc-metadata-list-summary-item__t" href="/title/tt4/">Y</a>',
+    '<a class="ipc-metadata-list-summary-item__t">no href</a>',
+    '<div data-testid="hero-media__poster"><div><img class="ipc-image" src="https://m.media-amazon.com/images/M/a._V1_QL75_.jpg"></div></div>',
+    '<div data-testid="hero-media__poster"><img class="other" src="/no.jpg"></div><img class="ipc-image" src="/outside.jpg">',
+    "<div class='x' data-testid='hero-media__poster'><img alt='p' src='/b.jpg' class='ipc-image' /></div>",
+    '<div data-testid="hero-media__poster"></div>',
+    '<p>nothing here</p>',
+]
+
+
+def filler(rng, size):
+    """Nested divs, spans and images like the rest of an IMDb page."""
+    parts = []
+    while sum(map(len, parts)) < size:
+        n = rng.randrange(1_000_000)
+        parts.append(f'<div class="sc-{n} ipc-page-section"><span data-testid="t{n}">Item {n}</span>'
+                     f'<img class="ipc-image" src="https://m.media-amazon.com/images/M/{n}.jpg" alt="{n}">'
+                     f'<a class="ipc-link" href="/name/nm{n}/">Name {n}</a></div>')
+    return "".join(parts)
+
+
+def build_pages(count, size):
+    rng = random.Random(1)
+    pages = []
+    for n in range(count):
+        if n % 2:
+            body = filler(rng, size // 2) + f'<ul><li><a class="ipc-metadata-list-summary-item__t" href="/title/tt{n:07d}/?ref_=fn_al_tt_1">Result</a></li></ul>' + filler(rng, size // 2)
+        else:
+            body = filler(rng, size // 2) + f'<div data-testid="hero-media__poster"><div class="ipc-media"><img class="ipc-image" src="https://m.media-amazon.com/images/M/{n}._V1_QL75_UX380_.jpg"></div></div>' + filler(rng, size // 2)
+        pages.append(f"<html><head><title>IMDb</title></head><body>{body}</body></html>")
+    return pages
+
+
+def soup_result_href(page):
+    tag = BeautifulSoup(page, 'html.parser').select_one("a.ipc-metadata-list-summary-item__t")
+    return tag.get('href') if tag else None
+
+
+def soup_poster_src(page):
+    tag = BeautifulSoup(page, 'html.parser').select_one('div[data-testid="hero-media__poster"] img.ipc-image')
+    return tag.get('src') if tag else None
+
+
+def check(pages):
+    mismatches = 0
+    for page in CASES + pages:
+        for fast, slow in ((imdb_html.extract_result_href, soup_result_href), (imdb_html.extract_poster_src, soup_poster_src)):
+            if fast(page) != slow(page):
+                mismatches += 1
+                print(f"MISMATCH {fast.__name__}: {fast(page)!r} != {slow(page)!r} for {page[:120]!r}")
+    return mismatches
+
+
+async def measure(label, parse, pages, concurrency):
+    """Parses every page (as both kinds, like one poster lookup) while sampling loop lag every 10 ms."""
+    lags = []
+
+    async def sample():
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append((loop.time() - started - 0.01) * 1000)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(page):
+        async with slots:
+            # The sleeps stand in for the search and title page requests of a real lookup
+            await asyncio.sleep(0)
+            await parse(imdb_html.extract_result_href, soup_result_href, page)
+            await asyncio.sleep(0)
+            await parse(imdb_html.extract_poster_src, soup_poster_src, page)
+
+    sampler = asyncio.create_task(sample())
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(page) for page in pages))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    lags.sort()
+    p99 = lags[max(0, int(len(lags) * 0.99) - 1)] if lags else 0
+    print(f"{label:<20} {len(pages) / elapsed:8.1f} pages/sec   loop lag p50={statistics.median(lags or [0]):7.2f} ms  "
+          f"p99={p99:7.2f} ms  max={max(lags or [0]):7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--size", type=int, default=400_000, help="approximate bytes per page")
+    parser.add_argument("--concurrency", type=int, default=4, help="lookups in flight at once")
+    parser.add_argument("--workers", type=int, default=Config.IMDB_PARSE_WORKERS)
+    args = parser.parse_args()
+
+    pages = build_pages(args.pages, args.size)
+    mismatches = check(pages[:20])
+    print(f"{len(CASES) + min(20, len(pages))} pages checked against BeautifulSoup, {mismatches} mismatches\n")
+
+    async def soup_inline(fast, slow, page):
+        return slow(page)
+
+    async def fast_inline(fast, slow, page):
+        return fast(page)
+
+    async def fast_pool(fast, slow, page):
+        return await imdb_html.extract(fast, page)
+
+    await measure("soup on loop", soup_inline, pages, args.concurrency)
+    await measure("targeted on loop", fast_inline, pages, args.concurrency)
+    Config.IMDB_PARSE_WORKERS = args.workers
+    imdb_html.start_pool()
+    await measure(f"pool x{args.workers}", fast_pool, pages, args.concurrency)
+    imdb_html.shutdown_pool()
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Measures ingest throughput (files/sec) of the worker pool in bot.py at
+different worker counts. Telegram and Mongo are replaced by fakes with a
+fixed latency, so only the worker scheduling is measured.
+
+    python -m benchmarks.ingest --files 300 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+import bot as bot_module
+from bot import Bot
+from utils.rate_limiter import TokenBucket
+
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id, file_name, copy_latency):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = message_id
+        self.media = SimpleNamespace(value="document")
+        self.document = SimpleNamespace(file_name=file_name, file_unique_id=f"uid{chat_id}_{message_id}", file_size=1024)
+        self.video = self.audio = None
+        self.copy_latency = copy_latency
+
+    async def copy(self, chat_id):
+        await asyncio.sleep(self.copy_latency)
+        return FakeMessage(chat_id, self.id, self.document.file_name, 0)
+
+
+async def run(workers, files, owners, copy_latency, save_latency, rate, journal):
+    async def fake_save_file_data(owner_id, original_message, copied_message):
+        await asyncio.sleep(save_latency)
+        return asyncio.ensure_future(asyncio.sleep(0))
+
+    async def no_post(self, user_id, batch_key):
+        return
+
+    async def default_settings(user_id):
+        return None
+
+    bot_module.save_file_data = fake_save_file_data
+    bot_module.get_user = default_settings
+    Bot.process_batch_task = no_post
+    bot_module.Config.FILE_WORKERS = workers
+    bot_module.Config.JOURNAL_FILE = journal
+
+    bot = Bot()
+    bot.owner_db_channel_id = -100
+    bot.rate_limiter = TokenBucket(rate, int(rate))
+    tasks = [asyncio.create_task(bot.file_processor_worker(i)) for i in range(workers)]
+
+    start = time.perf_counter()
+    for n in range(files):
+        owner = n % owners
+        await bot.enqueue_file(FakeMessage(-1000 - owner, n, f"Show.S01E{n:03d}.720p.mkv", copy_latency), owner)
+    await asyncio.gather(*(queue.join() for queue in bot.file_queues))
+    await asyncio.gather(*bot.pending_saves)
+    elapsed = time.perf_counter() - start
+    for task in tasks: task.cancel()
+    return files / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--owners", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--copy-latency", type=float, default=0.15, help="seconds per message.copy")
+    parser.add_argument("--save-latency", type=float, default=0.05, help="seconds per save_file_data")
+    parser.add_argument("--rate", type=float, default=1000, help="token bucket rate (files/sec)")
+    parser.add_argument("--journal", default=":memory:", help="ingest journal path (use a file to include fsync cost)")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        rate = await run(workers, args.files, args.owners, args.copy_latency, args.save_latency, args.rate, args.journal)
+        print(f"workers={workers:<3} {rate:8.2f} files/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
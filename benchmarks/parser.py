@@ -0,0 +1,130 @@
+"""
+Checks utils/parser.py against the regex code it replaced and times both
+on a corpus of release names. Exits non-zero if any title, year or batch
+key differs from the old output.
+
+    python -m benchmarks.parser --rounds 200
+"""
+import argparse
+import re
+import sys
+import time
+
+from utils import parser
+
+CORPUS = [
+    "[@MoviesHub] The.Boys.S01E01.1080p.WEB-DL.Hindi.English.mkv",
+    "The.Boys.S01E02.720p.WEBRip.x264.mkv",
+    "The Boys S01 E03 480p.mkv",
+    "Mirzapur.S02E05.2020.1080p.AMZN.WEB-DL.DDP5.1.H.264.mkv",
+    "Panchayat.Season.3.Episode.2.720p.HEVC.mkv",
+    "Money.Heist.S03.EP05.Dual.Audio.Hindi.720p.mkv",
+    "Dark.S02E08.German.1080p.NF.WEBRip.x265.HEVC.Esubs.mkv",
+    "Breaking_Bad_S05E14_Ozymandias_1080p_BluRay.mkv",
+    "Oppenheimer.2023.2160p.UHD.BluRay.x265.HDR.mkv",
+    "Oppenheimer (2023) 1080p BluRay x264 AAC.mp4",
+    "Jawan.2023.Hindi.1080p.HDRip.x264.AAC.Esubs.mkv",
+    "Pathaan [2023] Hindi 720p WEB-DL.mkv",
+    "KGF.Chapter.2.2022.Hindi.1080p.BluRay.mkv",
+    "Avengers.Endgame.2019.4k.HDR.mkv",
+    "Interstellar.2014.IMAX.1080p.BluRay.x264.mkv",
+    "The.Family.Man.S02.Complete.720p.AMZN.WEBRip.zip",
+    "Sacred.Games.Season.2.Part.1.Hindi.720p.mkv",
+    "Kota_Factory_S03E01_1080p_NF_WEB-DL.mkv",
+    "Stranger.Things.S04E09.Chapter.Nine.2160p.NF.WEB-DL.mkv",
+    "Loki.S02E06.Glorious.Purpose.1080p.DSNP.WEB-DL.mkv",
+    "Peaky.Blinders.S06E01.720p.HDTV.x264.mkv",
+    "Naruto Shippuden EP245 [720p] [Dual Audio].mkv",
+    "One.Piece.E1071.1080p.WEB.x264.mkv",
+    "Arijit Singh - Tum Hi Ho.mp3",
+    "RRR.2022.Part.2.1080p.mkv",
+    "Dune Part Two 2024 1080p WEBRip.mkv",
+    "[@Channel] [@Other] Animal.2023.Uncut.1080p.mkv",
+    "12th.Fail.2023.1080p.HDRip.mkv",
+    "1917.2019.1080p.BluRay.mkv",
+    "2012.2009.720p.BluRay.mkv",
+    "Blade.Runner.2049.2017.2160p.mkv",
+    "Untitled.mkv",
+    "S01E01.mkv",
+    "Wednesday.S01E01.Wednesdays.Child.Is.Full.of.Woe.1080p.mkv",
+    "Heeramandi {2024} S01 Complete 1080p.mkv",
+    "The.Office.US.S09E23.Finale.720p.mkv",
+    "Game.of.Thrones.S08E06.The.Iron.Throne.1080p.AMZN.WEB-DL.mkv",
+    "Sherlock.S04E03.The.Final.Problem.720p.BluRay.mkv",
+    "Mission.Impossible.Dead.Reckoning.Part.One.2023.1080p.mkv",
+    "Spider-Man.Across.the.Spider-Verse.2023.1080p.WEB-DL.mkv",
+]
+
+
+# --- The implementations utils/parser.py replaced, kept verbatim as the parity reference ---
+
+def legacy_get_batch_key(filename: str):
+    name = re.sub(r'\.\w+$', '', filename)
+    name = re.sub(r'[\._]', ' ', name)
+    delimiters = [
+        r'S\d{1,2}', r'Season\s?\d{1,2}', r'Part\s?\d{1,2}', r'E\d{1,3}', r'EP\d{1,3}',
+        r'\b(19|20)\d{2}\b', r'\b(4k|2160p|1080p|720p|480p)\b', r'\[.*?\]'
+    ]
+    match = re.search('|'.join(delimiters), name, re.I)
+    base_name = name[:match.start()].strip() if match else name.strip()
+    return re.sub(r'\s+', ' ', base_name).lower()
+
+
+def legacy_clean_filename(name: str):
+    if not name: return "Untitled", None
+    name = re.sub(r'\[@.*?\]', '', name)
+    cleaned_name = re.sub(r'\.\w+$', '', name)
+    cleaned_name = re.sub(r'[\._]', ' ', cleaned_name)
+    year_match = re.search(r'\b(19|20)\d{2}\b', cleaned_name)
+    year = year_match.group(0) if year_match else None
+    if year: cleaned_name = cleaned_name.split(year)[0]
+    cleaned_name = re.sub(r'\[.*?\]|\(.*?\)|\{.*?\}', '', cleaned_name)
+    tags_to_remove = ['1080p', '720p', '480p', '2160p', '4k', 'HD', 'FHD', 'UHD', 'BluRay', 'WEBRip', 'WEB-DL', 'HDRip', 'x264', 'x265', 'HEVC', 'AAC', 'Dual Audio', 'Hindi', 'English', 'Esubs', r'S\d+E\d+', r'S\d+', r'Season\s?\d+', r'Part\s?\d+', r'E\d+', r'EP\d+']
+    for tag in tags_to_remove:
+        cleaned_name = re.sub(r'\b' + tag + r'\b', '', cleaned_name, flags=re.I)
+    final_title = re.sub(r'\s+', ' ', cleaned_name).strip()
+    if not final_title:
+        final_title = re.sub(r'\.\w+$', '', name).replace(".", " ")
+    return (f"{final_title} {year}".strip() if year else final_title), year
+
+
+def check_parity():
+    mismatches = 0
+    for name in CORPUS:
+        old = (legacy_get_batch_key(name), legacy_clean_filename(name))
+        new = (parser.get_batch_key(name), parser.clean_filename(name))
+        if old != new:
+            mismatches += 1
+            print(f"MISMATCH {name!r}\n  old: {old}\n  new: {new}")
+    print(f"parity: {len(CORPUS) - mismatches}/{len(CORPUS)} names identical")
+    return mismatches
+
+
+def timed(label, func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for name in CORPUS:
+            func(name)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<26} {elapsed / (rounds * len(CORPUS)) * 1e6:8.2f} us/name")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--rounds", type=int, default=200)
+    arg_parser.add_argument("--show", action="store_true", help="print the parsed fields of every name")
+    args = arg_parser.parse_args()
+
+    mismatches = check_parity()
+    if args.show:
+        for name in CORPUS:
+            print(parser.parse_filename(name))
+
+    timed("legacy (both functions)", lambda n: (legacy_get_batch_key(n), legacy_clean_filename(n)), args.rounds)
+    timed("parser, cold (no memo)", lambda n: (parser.parse_filename.__wrapped__(n)), args.rounds)
+    timed("parser, memoized", lambda n: (parser.get_batch_key(n), parser.clean_filename(n)), args.rounds)
+    return mismatches
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main() else 0)
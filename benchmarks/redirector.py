@@ -0,0 +1,84 @@
+"""
+Load test for the /get redirector. Reports requests/sec and latency
+percentiles for a mix of known and unknown (scraper) file IDs.
+
+    python -m benchmarks.redirector                               # in-process app, no Mongo
+    python -m benchmarks.redirector --url http://127.0.0.1:7071 --ids ids.txt
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+from aiohttp import web
+
+import database.db as db
+from features.redirector import Redirector, create_app
+
+
+async def start_local_app(port, known_ids):
+    db.known_file_ids.update(known_ids)
+    db.known_file_ids_state['loaded'] = True
+    redirector = Redirector()
+    redirector.set_username("BenchBot")
+    redirector.last_refresh = float('inf')  # never query Mongo from the benchmark
+    runner = web.AppRunner(create_app(redirector), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def worker(session, base_url, ids, unknown_ratio, deadline, timings, statuses):
+    while time.perf_counter() < deadline:
+        file_id = f"scraper{random.randint(0, 10**9)}" if random.random() < unknown_ratio else random.choice(ids)
+        start = time.perf_counter()
+        async with session.get(f"{base_url}/get/{file_id}", allow_redirects=False) as resp:
+            await resp.read()
+            statuses[resp.status] = statuses.get(resp.status, 0) + 1
+        timings.append(time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="redirector base URL (defaults to an in-process app)")
+    parser.add_argument("--ids", help="file with one known file_unique_id per line")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--unknown-ratio", type=float, default=0.3)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    if args.ids:
+        with open(args.ids) as f:
+            ids = [line.strip() for line in f if line.strip()]
+    else:
+        ids = [f"AgAD{n:08d}" for n in range(100000)]
+
+    runner = None
+    base_url = args.url
+    if not base_url:
+        runner = await start_local_app(args.port, ids)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    timings, statuses = [], {}
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        deadline = time.perf_counter() + args.duration
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker(session, base_url, ids, args.unknown_ratio, deadline, timings, statuses)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    if runner:
+        await runner.cleanup()
+
+    timings.sort()
+    pct = lambda p: timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+    print(f"{len(timings)} requests in {elapsed:.1f}s: {len(timings) / elapsed:.0f} req/s")
+    print(f"p50={pct(0.50):.2f} ms  p99={pct(0.99):.2f} ms  statuses={dict(sorted(statuses.items()))}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
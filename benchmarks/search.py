@@ -0,0 +1,73 @@
+"""
+Compares the old unanchored $regex search with search_user_files on a
+scratch database. Needs a local mongod; seeding 100k files takes a minute.
+
+    MONGO_URI=mongodb://localhost:27017 DATABASE_NAME=bench python -m benchmarks.search --files 100000
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from database.db import db, files, ensure_indexes, search_user_files
+from utils.helpers import get_search_tokens
+
+OWNER_ID = 424242
+TITLES = ["The Boys", "Dark", "Breaking Bad", "Mirzapur", "Panchayat", "The Family Man", "Sacred Games",
+          "Money Heist", "Stranger Things", "Loki", "Wednesday", "Peaky Blinders", "Narcos", "Kota Factory",
+          "पठान", "Amélie"]
+QUALITIES = ["480p", "720p", "1080p", "2160p"]
+QUERIES = ["boys", "the family", "dark s02", "money heist s03e05", "stranger thi", "panchayat 720p", "mirz", "पठान", "amél"]
+
+
+async def seed(count):
+    existing = await files.count_documents({'owner_id': OWNER_ID})
+    batch = []
+    for n in range(existing, count):
+        title = random.choice(TITLES)
+        name = f"{title.replace(' ', '.')}.S{random.randint(1, 5):02d}E{random.randint(1, 24):02d}.{random.choice(QUALITIES)}.WEB-DL.mkv"
+        batch.append({'owner_id': OWNER_ID, 'file_unique_id': f'bench{n}', 'file_id': n,
+                      'file_name': name, 'search_tokens': get_search_tokens(name)})
+        if len(batch) == 5000:
+            await files.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await files.insert_many(batch, ordered=False)
+
+
+async def regex_search(query, page_size=5):
+    search_filter = {'owner_id': OWNER_ID, 'file_name': {'$regex': query, '$options': 'i'}}
+    total = await files.count_documents(search_filter)
+    return await files.find(search_filter).sort('_id', -1).limit(page_size).to_list(length=page_size), total
+
+
+async def timed(label, call, rounds):
+    timings = []
+    for _ in range(rounds):
+        for query in QUERIES:
+            start = time.perf_counter()
+            await call(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<14} p50={statistics.median(timings):8.2f} ms  p99={timings[int(len(timings) * 0.99) - 1]:8.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    await ensure_indexes()
+    await seed(args.files)
+    print(f"{await files.count_documents({'owner_id': OWNER_ID})} files for owner {OWNER_ID}")
+    await timed("$regex", regex_search, args.rounds)
+    await timed("token index", lambda q: search_user_files(OWNER_ID, q), args.rounds)
+
+
+if __name__ == "__main__":
+    if db.name == 'telegram_bot':
+        sys.exit("Refusing to seed the production database; set DATABASE_NAME to a scratch database.")
+    asyncio.run(main())
@@ -0,0 +1,285 @@
+"""
+End-to-end benchmark suite. Runs the real ingest workers, deep-link delivery,
+search and backup code against a local mongod, with Telegram replaced by
+benchmarks.fakes.FakeTelegram and IMDb/the shortener by a local HTTP stub.
+
+    MONGO_URI=mongodb://localhost:27017 DATABASE_NAME=bench python -m benchmarks.suite
+    ... --only ingest deeplink --telegram-latency 0.1 --flood-rate 0.01
+    ... --save-baseline main            # writes benchmarks/baselines/main.json
+    ... --compare main --tolerance 0.2  # exits 1 if a metric regressed by more than 20%
+
+Reports ingest files/sec, deep-link p50/p99, search p50/p99 over --search-files
+seeded files, and backup posts/min. Telegram pacing (FILE_RATE_LIMIT,
+POST_CHANNEL_RATE, BACKUP_POST_INTERVAL) is lifted so the bot's own overhead is
+what gets measured; FloodWaits still come from --flood-rate. Seeded search
+files are kept between runs; everything else is reset per scenario.
+"""
+import os
+
+# Must be set before config is imported
+os.environ.setdefault("JOURNAL_FILE", ":memory:")
+os.environ.setdefault("TRACE_FILE", "")
+
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from config import Config
+from database.db import (
+    db, users, files, backups, poster_cache, shortlinks, ensure_indexes, invalidate_user, load_channel_owners,
+    set_owner_db_channel, derived_file_fields, file_writes
+)
+from benchmarks.fakes import FakeTelegram, FakeFileMessage, StubServer, RoutingSession
+from utils import imdb_html
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+# Owners are far away from real Telegram IDs so a scratch database can hold other data too
+INGEST_OWNER, DELIVERY_OWNER, SEARCH_OWNER, BACKUP_OWNER = 990001, 990002, 990003, 990004
+OWNER_DB_CHANNEL = -1009900000000
+TITLES = ["The Boys", "Dark", "Breaking Bad", "Mirzapur", "Panchayat", "The Family Man", "Sacred Games",
+          "Money Heist", "Stranger Things", "Loki", "Wednesday", "Peaky Blinders", "Narcos", "Kota Factory"]
+QUALITIES = ["480p", "720p", "1080p", "2160p"]
+QUERIES = ["boys", "the family", "dark s02", "money heist s03e05", "stranger thi", "panchayat 720p", "mirz"]
+# Which way is better for each reported metric
+HIGHER_IS_BETTER = {'ingest_files_per_sec', 'backup_posts_per_min'}
+
+
+def file_name(n, titles=TITLES):
+    rng = random.Random(n)
+    title = rng.choice(titles)
+    return f"{title.replace(' ', '.')}.S{rng.randint(1, 5):02d}E{rng.randint(1, 24):02d}.{rng.choice(QUALITIES)}.WEB-DL.mkv"
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.99) - 1)]
+
+
+async def set_owner(owner_id, **settings):
+    defaults = {'post_channels': [], 'db_channels': [], 'fsub_channel': None, 'shortener_enabled': False,
+                'shortener_url': None, 'shortener_api': None, 'show_poster': True, 'footer_buttons': []}
+    await users.update_one({'user_id': owner_id}, {'$set': {'user_id': owner_id, **defaults, **settings}}, upsert=True)
+    invalidate_user(owner_id)
+
+
+async def seed_files(telegram, owner_id, count, prefix, first_id, register=True):
+    """
+    Inserts `count` file records for an owner (keeping existing ones), with
+    Owner DB message IDs from `first_id`, and registers them with the fake Telegram.
+    """
+    existing = await files.count_documents({'owner_id': owner_id})
+    batch = []
+    for n in range(existing, count):
+        name = file_name(n)
+        batch.append({'owner_id': owner_id, 'file_unique_id': f'{prefix}{n}', 'file_id': first_id + n,
+                      'file_name': name, 'file_size': 1024 * 1024, **derived_file_fields(name)})
+        if len(batch) == 10000:
+            await files.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await files.insert_many(batch, ordered=False)
+    if not register:
+        return
+    async for doc in files.find({'owner_id': owner_id}, {'file_id': 1, 'file_name': 1, 'file_unique_id': 1}).limit(max(count, 0)):
+        telegram.files[doc['file_id']] = (doc['file_name'], doc['file_unique_id'])
+
+
+def bench_client(telegram, session):
+    """A stand-in for the Bot in handlers that only need its Telegram methods and shared state."""
+    client = SimpleNamespace(me=SimpleNamespace(username="bench_bot"), http_session=session, owner_db_channel_id=OWNER_DB_CHANNEL)
+    return telegram.install(client)
+
+
+def fake_query(user_id, data=""):
+    async def noop(*args, **kwargs):
+        return message
+    message = SimpleNamespace(edit_text=noop, delete=noop, reply_text=noop)
+    return SimpleNamespace(from_user=SimpleNamespace(id=user_id), data=data, message=message, answer=noop)
+
+
+async def bench_ingest(args, telegram, session):
+    """Channel posts through new_file_handler, the worker pool and the real file_writes buffer, until every file is acked."""
+    from bot import Bot
+    from handlers.new_post import new_file_handler
+    await files.delete_many({'owner_id': INGEST_OWNER})
+    db_channels = [-1009900000100 - n for n in range(args.channels)]
+    await set_owner(INGEST_OWNER, db_channels=db_channels, post_channels=[-1009900000200, -1009900000201], batch_idle_window=1)
+    await load_channel_owners()
+
+    bot = Bot()
+    telegram.install(bot)
+    bot.me = SimpleNamespace(username="bench_bot")
+    bot.http_session = session
+    bot.owner_db_channel_id = OWNER_DB_CHANNEL
+    workers = [asyncio.create_task(bot.file_processor_worker(i)) for i in range(len(bot.file_queues))]
+    try:
+        start = time.perf_counter()
+        for n in range(args.ingest_files):
+            channel = db_channels[n % len(db_channels)]
+            await new_file_handler(bot, FakeFileMessage(telegram, channel, n + 1, file_name(n), f'ingest{n}'))
+        while bot.processed_files < args.ingest_files:
+            if time.perf_counter() - start > args.timeout:
+                raise TimeoutError(f"ingest: {bot.processed_files}/{args.ingest_files} files after {args.timeout}s")
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        # Let the open batches post, so their work does not leak into the next scenario
+        while bot.batch_windows and time.perf_counter() - start < args.timeout:
+            await asyncio.sleep(0.1)
+    finally:
+        for task in workers: task.cancel()
+    return {'ingest_files_per_sec': args.ingest_files / elapsed}
+
+
+async def bench_deeplink(args, telegram, session):
+    """The two /start steps of a download: FSub check and shortlink (get_), then the copy (finalget_)."""
+    from handlers.start import handle_file_request, send_file
+    fsub_channel = -1009900000300
+    await set_owner(DELIVERY_OWNER, fsub_channel=fsub_channel, shortener_enabled=True,
+                    shortener_url="short.bench", shortener_api="bench")
+    await seed_files(telegram, DELIVERY_OWNER, args.deeplink_files, 'deeplink', 10_000_000)
+    unique_ids = [doc['file_unique_id'] async for doc in files.find({'owner_id': DELIVERY_OWNER}, {'file_unique_id': 1})]
+    client = bench_client(telegram, session)
+    rng = random.Random(7)
+    timings = []
+    for n in range(args.deeplink_requests):
+        user_id, unique_id = 500000 + rng.randrange(args.deeplink_users), rng.choice(unique_ids)
+        start = time.perf_counter()
+        await handle_file_request(client, fake_query(user_id).message, user_id, f"get_{unique_id}")
+        await send_file(client, user_id, unique_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p99 = percentiles(timings)
+    return {'deeplink_p50_ms': p50, 'deeplink_p99_ms': p99}
+
+
+async def bench_search(args, telegram, session):
+    """First result pages of _format_and_send_search_results, as after a user sends a search query."""
+    from handlers.settings import _format_and_send_search_results, SEARCH_SESSIONS
+    await set_owner(SEARCH_OWNER)
+    existing = await files.count_documents({'owner_id': SEARCH_OWNER})
+    if existing < args.search_files:
+        print(f"Seeding {args.search_files - existing} search files (kept for later runs)...")
+        await seed_files(telegram, SEARCH_OWNER, args.search_files, 'search', 20_000_000, register=False)
+    client = bench_client(telegram, session)
+    timings = []
+    for _ in range(args.search_rounds):
+        for search_query in QUERIES:
+            session_id = secrets.token_hex(4)
+            SEARCH_SESSIONS.set(session_id, {'query': search_query, 'total': None})
+            start = time.perf_counter()
+            await _format_and_send_search_results(client, fake_query(SEARCH_OWNER), SEARCH_OWNER, session_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    p50, p99 = percentiles(timings)
+    return {'search_p50_ms': p50, 'search_p99_ms': p99}
+
+
+async def bench_backup(args, telegram, session):
+    """A full Smart Backup of --backup-files files through start_backup_process."""
+    from handlers.settings import start_backup_process
+    channel_id = -1009900000400
+    await set_owner(BACKUP_OWNER, post_channels=[channel_id])
+    await files.delete_many({'owner_id': BACKUP_OWNER})
+    await backups.delete_many({'owner_id': BACKUP_OWNER})
+    await seed_files(telegram, BACKUP_OWNER, args.backup_files, 'backup', 30_000_000)
+    client = bench_client(telegram, session)
+    start = time.perf_counter()
+    await start_backup_process(client, fake_query(BACKUP_OWNER, f"start_backup_{channel_id}"))
+    elapsed = time.perf_counter() - start
+    checkpoint = await backups.find_one({'owner_id': BACKUP_OWNER, 'channel_id': channel_id})
+    if not checkpoint or checkpoint.get('status') != 'done':
+        raise RuntimeError(f"backup did not finish: {checkpoint}")
+    return {'backup_posts_per_min': checkpoint['posted'] / elapsed * 60}
+
+
+SCENARIOS = {'ingest': bench_ingest, 'deeplink': bench_deeplink, 'search': bench_search, 'backup': bench_backup}
+
+
+def compare(results, baseline, tolerance):
+    """Prints each metric against the baseline. Returns the names of the ones that regressed by more than `tolerance`."""
+    regressions = []
+    for name, value in results.items():
+        old = baseline.get(name)
+        if not old:
+            print(f"{name:<24} {value:10.2f}   (no baseline)")
+            continue
+        change = (value - old) / old
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"{name:<24} {value:10.2f}   baseline {old:10.2f}   {change:+7.1%} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="seconds per fake Telegram call")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of Telegram calls that raise FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--http-latency", type=float, default=0.1, help="seconds per IMDb/shortener stub request")
+    parser.add_argument("--ingest-files", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=4, help="DB channels the ingested files are spread over")
+    parser.add_argument("--deeplink-files", type=int, default=1000)
+    parser.add_argument("--deeplink-users", type=int, default=200)
+    parser.add_argument("--deeplink-requests", type=int, default=1000)
+    parser.add_argument("--search-files", type=int, default=1_000_000)
+    parser.add_argument("--search-rounds", type=int, default=20)
+    parser.add_argument("--backup-files", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a scenario is abandoned")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # As in Bot.start(): fork the parser workers before Motor and aiohttp start their threads
+    imdb_html.start_pool()
+    Config.FILE_RATE_LIMIT = Config.FILE_RATE_BURST = 10000
+    Config.POST_CHANNEL_RATE, Config.POST_CHANNEL_BURST = 10000, 10000
+    Config.BACKUP_POST_INTERVAL = 0.0001
+    telegram = FakeTelegram(args.telegram_latency, args.flood_rate, args.flood_seconds)
+    stub = await StubServer(args.http_latency).start()
+    session = RoutingSession(stub)
+    await ensure_indexes()
+    await set_owner_db_channel(OWNER_DB_CHANNEL)
+    await poster_cache.delete_many({})
+    await shortlinks.delete_many({})
+
+    results = {}
+    try:
+        for name in args.only:
+            print(f"Running {name}...")
+            results.update(await SCENARIOS[name](args, telegram, session))
+        await file_writes.flush()
+    finally:
+        await session.close()
+        await stub.stop()
+        imdb_html.shutdown_pool()
+
+    print(f"\nTelegram calls: {dict(telegram.calls)}; FloodWaits: {telegram.floodwaits}; stub requests: {dict(stub.requests)}\n")
+    regressions = []
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        regressions = compare(results, baseline['results'], args.tolerance)
+    else:
+        for name, value in results.items():
+            print(f"{name:<24} {value:10.2f}")
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps({'args': vars(args), 'results': results}, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {path}")
+    if regressions:
+        sys.exit(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    if "MONGO_URI" not in os.environ or db.name == 'telegram_bot':
+        sys.exit("Set MONGO_URI to a local mongod and DATABASE_NAME to a scratch database; the suite deletes data.")
+    asyncio.run(main())
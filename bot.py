@@ -2,13 +2,28 @@ import logging
 import sys
 import os
 import asyncio
+import time
+import hashlib
+from collections import Counter
 from pyromod import Client
 from aiohttp import web
 from config import Config
-from database.db import get_user, save_file_data, get_owner_db_channel, set_owner_db_channel
-from utils.helpers import create_post
-from handlers.new_post import get_batch_key
+from database.db import get_user, save_file_data, get_owner_db_channel, set_owner_db_channel, ensure_indexes, watch_user_changes, backfill_file_fields, file_writes, load_channel_owners
+from utils.helpers import create_post, get_batch_settings
+from utils.parser import get_batch_key
+from features.poster import send_post
+from features.backup import fetch_messages
 from pyrogram import enums
+from pyrogram.errors import FloodWait, ChatWriteForbidden, ChannelPrivate, ChatAdminRequired, PeerIdInvalid
+from utils.rate_limiter import TokenBucket
+from database.journal import IngestJournal
+from utils.http import create_http_session
+from features.redirector import Redirector, create_app
+from features.broadcaster import resume_broadcasts
+from utils.metrics import Gauge, Histogram, record_floodwait, render_metrics, monitor_loop_lag
+from utils.imdb_html import start_pool as start_parse_pool, shutdown_pool as shutdown_parse_pool
+from utils.tracing import Trace, current_trace, span, exporter as trace_exporter
+from utils.snapshot import load_snapshot, save_snapshot, snapshot_loop
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -17,21 +32,16 @@ logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logging.getLogger("pyromod").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-# Web Server Handler
-async def handle_redirect(request):
-    file_unique_id = request.match_info.get('file_unique_id', None)
-    if not file_unique_id:
-        return web.Response(text="File ID missing.", status=400)
-    try:
-        with open(Config.BOT_USERNAME_FILE, 'r') as f:
-            bot_username = f.read().strip().replace("@", "")
-    except FileNotFoundError:
-        logger.error(f"FATAL: Bot username file not found at {Config.BOT_USERNAME_FILE}")
-        return web.Response(text="Bot configuration error.", status=500)
-    payload = f"get_{file_unique_id}"
-    telegram_url = f"https://t.me/{bot_username}?start={payload}"
-    return web.HTTPFound(telegram_url)
+FILE_QUEUE_DEPTH = Gauge("file_queue_depth", "Files waiting in each worker's queue.", ("worker",))
+WORKER_STEP_SECONDS = Histogram("worker_step_seconds", "Per-file ingest latency: 'copy' to the Owner DB, 'save' until the record is written.", ("step",))
+BATCH_SIZE = Histogram("batch_size_files", "Files per posted batch.", buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+STARTUP_PHASE_SECONDS = Gauge("startup_phase_seconds", "Time each phase of the last start took.", ("phase",))
+BATCH_WINDOW_SECONDS = Histogram("batch_window_seconds", "Time from a batch's first file to its flush.", ("reason",), buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600))
 
+def delivery_post_id(user_id, batch_key, messages):
+    """Identifies a batch post by owner, key and files, so a replayed batch maps to the same ledger entries."""
+    message_ids = ",".join(str(message_id) for message_id in sorted(m.id for m in messages))
+    return hashlib.sha1(f"{user_id}|{batch_key}|{message_ids}".encode()).hexdigest()
 
 class Bot(Client):
     def __init__(self):
@@ -44,9 +54,29 @@ class Bot(Client):
         self.owner_db_channel_id = None
         self.web_app = None
         self.web_runner = None
-        self.file_queue = asyncio.Queue()
+        self.http_session = None
+        self.redirector = Redirector()
+        # One queue per worker; an owner is always routed to the same worker so their files stay in order.
+        self.file_queues = [asyncio.Queue() for _ in range(Config.FILE_WORKERS)]
+        self.rate_limiter = TokenBucket(Config.FILE_RATE_LIMIT, Config.FILE_RATE_BURST)
+        self.processed_files = 0
+        self.journal = IngestJournal(Config.JOURNAL_FILE)
+        # One token bucket per post channel, so a flood-limited channel only slows itself
+        self.channel_buckets = {}
         self.file_batch = {}
         self.batch_locks = {}
+        self.batch_windows = {}
+        # Tuning counters for the batch window: why batches were flushed and how big they were
+        self.batch_stats = {'flush_reasons': Counter(), 'sizes': Counter()}
+        self.worker_tasks = []
+        # Files whose record is still in the write buffer, finished by finish_file()
+        self.pending_saves = set()
+        # New files that arrive while start() replays the journal, queued once the replay is done
+        self.held_files = None
+        # Seconds taken by each phase of start(), for the startup log line and startup_phase_seconds
+        self.startup_phases = {}
+        FILE_QUEUE_DEPTH.callback = lambda: {(worker_id,): queue.qsize() for worker_id, queue in enumerate(self.file_queues)}
+        STARTUP_PHASE_SECONDS.callback = lambda: {(name,): seconds for name, seconds in self.startup_phases.items()}
 
     async def setup_database_channel(self):
         """
@@ -71,91 +101,331 @@ class Bot(Client):
             logger.error(f"   Please use the 'Set Owner DB' button again to fix it. Error details: {e}")
             self.owner_db_channel_id = None
 
-    async def file_processor_worker(self):
-        """The single worker that processes files from the queue one by one."""
-        logger.info("File processor worker started.")
+    async def enqueue_file(self, message, user_id, job_id=None):
+        """Journals a file (unless it is a journal replay) and routes it to the worker that owns this user's queue."""
+        media = getattr(message, message.media.value, None)
+        trace = Trace('file', owner=user_id, file=getattr(media, 'file_name', None), replayed=job_id is not None)
+        if job_id is None:
+            job_id = self.journal.enqueue(message.chat.id, message.id, user_id)
+            if self.held_files is not None:
+                # The journal replay is still queuing older files; this one goes after them
+                self.held_files.append((message, user_id, job_id, trace))
+                return
+        await self.file_queues[user_id % len(self.file_queues)].put((message, user_id, job_id, trace))
+
+    def queue_size(self):
+        return sum(queue.qsize() for queue in self.file_queues)
+
+    async def copy_to_owner_db(self, message):
+        """Copies a message to the Owner DB, paced by the shared token bucket."""
         while True:
+            await self.rate_limiter.acquire()
             try:
-                message_to_process, user_id = await self.file_queue.get()
-                
-                if not self.owner_db_channel_id:
-                    # FIX: Use the correct variable name 'message_to_process'
+                return await message.copy(chat_id=self.owner_db_channel_id)
+            except FloodWait as e:
+                logger.warning(f"FloodWait of {e.value}s while copying a file. Pausing all workers.")
+                record_floodwait('copy', e.value)
+                self.rate_limiter.penalize(e.value)
+
+    async def file_processor_worker(self, worker_id):
+        """One worker of the pool. Processes the files of its owners one by one."""
+        logger.info(f"File processor worker {worker_id} started.")
+        queue = self.file_queues[worker_id]
+        while True:
+            message_to_process, user_id, job_id, trace = await queue.get()
+            trace.add_span('queue_wait', trace.started)
+            try:
+                while not self.owner_db_channel_id:
                     media = message_to_process.document or message_to_process.video or message_to_process.audio
                     filename = getattr(media, 'file_name', 'Unknown Filename')
-                    logger.error(f"Owner DB not configured. Cannot process file '{filename}'. Worker is sleeping.")
+                    logger.error(f"Owner DB not configured. Cannot process file '{filename}'. Worker {worker_id} is sleeping.")
+                    # Retry the same item instead of re-queuing it, so the owner's order is kept
                     await asyncio.sleep(60)
-                    # Put the item back in the queue to be retried later
-                    await self.file_queue.put((message_to_process, user_id))
-                    continue
 
-                copied_message = await message_to_process.copy(chat_id=self.owner_db_channel_id)
-                await save_file_data(owner_id=user_id, original_message=message_to_process, copied_message=copied_message)
-                
-                filename = getattr(copied_message, copied_message.media.value).file_name
-                batch_key = get_batch_key(filename)
+                with WORKER_STEP_SECONDS.time(step='copy'), trace.span('copy'):
+                    copied_message = await self.copy_to_owner_db(message_to_process)
+                save_started = time.time()
+                write = await save_file_data(owner_id=user_id, original_message=message_to_process, copied_message=copied_message)
+                # The worker moves on to the next file while the record waits for its bulk write
+                task = asyncio.create_task(self.finish_file(user_id, job_id, copied_message, write, save_started, trace))
+                self.pending_saves.add(task)
+                task.add_done_callback(self.pending_saves.discard)
+            except Exception as e:
+                logger.exception(f"Error in file processor worker {worker_id}")
+                trace.finish(error=repr(e))
+            finally:
+                queue.task_done()
 
-                if user_id not in self.batch_locks: self.batch_locks[user_id] = {}
-                if batch_key not in self.batch_locks[user_id]:
-                    self.batch_locks[user_id][batch_key] = asyncio.Lock()
-                
-                async with self.batch_locks[user_id][batch_key]:
-                    if batch_key not in self.file_batch.setdefault(user_id, {}):
-                        self.file_batch[user_id][batch_key] = [copied_message]
-                        asyncio.create_task(self.process_batch_task(user_id, batch_key))
-                    else:
-                        self.file_batch[user_id][batch_key].append(copied_message)
-                
-                await asyncio.sleep(2)
+    async def finish_file(self, user_id, job_id, copied_message, write, save_started, trace):
+        """Batches and acks a file once its record is written. A failed write leaves the job in the journal."""
+        filename = getattr(copied_message, copied_message.media.value).file_name
+        try:
+            await write
+        except Exception as e:
+            logger.exception(f"Could not save file '{filename}' for user {user_id}; it will be retried on restart.")
+            trace.finish(error=repr(e))
+            return
+        finally:
+            WORKER_STEP_SECONDS.observe(time.time() - save_started, step='save')
+            trace.add_span('save', save_started)
+        await self.add_to_batch(user_id, get_batch_key(filename), copied_message, trace=trace)
+        self.journal.ack(job_id)
+        self.processed_files += 1
+
+    async def add_to_batch(self, user_id, batch_key, copied_message, deadline=None, trace=None):
+        """
+        Adds a copied file to its batch, starting the batch's post task if it is new.
+        Every file slides the batch deadline forward by the owner's idle window,
+        capped at max-wait from the first file; reaching max-size flushes at once.
+        The file's trace, if any, travels with the batch until it is published.
+        """
+        if user_id not in self.batch_locks: self.batch_locks[user_id] = {}
+        if batch_key not in self.batch_locks[user_id]:
+            self.batch_locks[user_id][batch_key] = asyncio.Lock()
+        
+        async with self.batch_locks[user_id][batch_key]:
+            now = time.time()
+            window = self.batch_windows.get((user_id, batch_key))
+            if batch_key not in self.file_batch.setdefault(user_id, {}):
+                idle, max_wait, max_size = get_batch_settings(await get_user(user_id))
+                window = {
+                    'started': now, 'idle': idle, 'max_wait': max_wait, 'max_size': max_size,
+                    'deadline': deadline if deadline is not None else now + idle,
+                    'flush': asyncio.Event(), 'traces': []
+                }
+                self.batch_windows[(user_id, batch_key)] = window
+                self.file_batch[user_id][batch_key] = [copied_message]
+                asyncio.create_task(self.process_batch_task(user_id, batch_key))
+            else:
+                self.file_batch[user_id][batch_key].append(copied_message)
+                window['deadline'] = max(window['deadline'], min(now + window['idle'], window['started'] + window['max_wait']))
+            if trace is not None:
+                window['traces'].append((trace, now))
+            if len(self.file_batch[user_id][batch_key]) >= window['max_size']:
+                window['flush'].set()
+            self.journal.add_batch_file(user_id, batch_key, copied_message.id, window['deadline'])
+
+    async def restore_journal(self):
+        """
+        Restores open batches and re-queues files that were never acked before the
+        last shutdown. Files posted meanwhile are held by enqueue_file and queued
+        after the replayed ones, so every owner's files keep their order.
+        """
+        try:
+            await self.replay_journal()
+        finally:
+            held, self.held_files = self.held_files or [], None
+            for message, user_id, job_id, trace in held:
+                await self.file_queues[user_id % len(self.file_queues)].put((message, user_id, job_id, trace))
+
+    async def replay_journal(self):
+        if not self.owner_db_channel_id:
+            logger.warning("Owner DB not set. Skipping journal replay until next restart.")
+            return
+        restored_batches = 0
+        open_batches = self.journal.open_batches()
+        batch_message_ids = [message_id for _, message_ids in open_batches.values() for message_id in message_ids]
+        try:
+            by_id = {m.id: m for m in await fetch_messages(self, self.owner_db_channel_id, batch_message_ids)}
+        except Exception:
+            logger.exception("Could not fetch the messages of open batches; they stay in the journal.")
+            open_batches = {}
+        for (user_id, batch_key), (deadline, message_ids) in open_batches.items():
+            messages = [by_id[message_id] for message_id in message_ids if message_id in by_id]
+            if not messages:
+                self.journal.close_batch(user_id, batch_key)
+                continue
+            for message in messages:
+                await self.add_to_batch(user_id, batch_key, message, deadline)
+            restored_batches += 1
+
+        pending = self.journal.pending()
+        # Files journaled after the bot connected are already held; they are not replayed twice
+        held_jobs = {job_id for _, _, job_id, _ in self.held_files or []}
+        pending = [job for job in pending if job[0] not in held_jobs]
+        fetched = {}
+        for chat_id in {chat_id for _, chat_id, _, _ in pending}:
+            message_ids = [message_id for _, job_chat_id, message_id, _ in pending if job_chat_id == chat_id]
+            try:
+                fetched[chat_id] = {m.id: m for m in await fetch_messages(self, chat_id, message_ids)}
             except Exception:
-                logger.exception("Error in file processor worker")
-            finally:
-                self.file_queue.task_done()
+                logger.exception(f"Could not fetch journaled messages from {chat_id}; they stay in the journal.")
+        requeued = 0
+        for job_id, chat_id, message_id, user_id in pending:
+            if chat_id not in fetched:
+                continue
+            message = fetched[chat_id].get(message_id)
+            if message is None:
+                # Deleted since it was journaled
+                self.journal.ack(job_id)
+                continue
+            await self.enqueue_file(message, user_id, job_id)
+            requeued += 1
+        if restored_batches or requeued:
+            logger.info(f"Journal replay: restored {restored_batches} open batches and re-queued {requeued} files.")
+
+    async def throughput_reporter(self, interval=60):
+        """Logs the ingest rate of the worker pool while files are flowing."""
+        last_count = self.processed_files
+        while True:
+            await asyncio.sleep(interval)
+            done = self.processed_files - last_count
+            last_count = self.processed_files
+            if done or self.queue_size():
+                logger.info(f"Ingest: {done / interval:.2f} files/sec with {len(self.file_queues)} workers, {self.queue_size()} files queued.")
+
+    async def wait_for_batch_window(self, window):
+        """Sleeps until the batch window closes and returns why it was flushed."""
+        while True:
+            remaining = window['deadline'] - time.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(window['flush'].wait(), timeout=remaining)
+                return 'max_size'
+            except asyncio.TimeoutError:
+                # The deadline may have been pushed forward by a new file; loop and re-check.
+                continue
+        return 'max_wait' if window['deadline'] >= window['started'] + window['max_wait'] else 'idle'
 
     async def process_batch_task(self, user_id, batch_key):
-        """The task that waits and posts a batch of files."""
+        """The task that waits for the batch window to close and posts the batch."""
+        messages = None
+        window = self.batch_windows[(user_id, batch_key)]
+        batch_trace = Trace('batch', owner=user_id, batch_key=batch_key)
+        current_trace.set(batch_trace)
+        reason, flushed_at, error = None, None, None
         try:
-            await asyncio.sleep(10)
+            reason = await self.wait_for_batch_window(window)
+            flushed_at = time.time()
             if user_id not in self.batch_locks or batch_key not in self.batch_locks.get(user_id, {}): return
             async with self.batch_locks[user_id][batch_key]:
                 messages = self.file_batch[user_id].pop(batch_key, [])
+                self.batch_windows.pop((user_id, batch_key), None)
                 if not messages: return
+                self.batch_stats['flush_reasons'][reason] += 1
+                self.batch_stats['sizes'][len(messages)] += 1
+                BATCH_SIZE.observe(len(messages))
+                BATCH_WINDOW_SECONDS.observe(time.time() - window['started'], reason=reason)
                 
                 user = await get_user(user_id)
                 if not user or not user.get('post_channels'): return
 
-                poster, caption, footer_keyboard = await create_post(self, user_id, messages)
+                with span('create_post'):
+                    poster, caption, footer_keyboard = await create_post(self, user_id, messages)
                 if not caption: return
 
-                for channel_id in user.get('post_channels', []):
-                    try:
-                        if poster:
-                            await self.send_photo(channel_id, photo=poster, caption=caption, reply_markup=footer_keyboard)
-                        else:
-                            await self.send_message(channel_id, caption, reply_markup=footer_keyboard, disable_web_page_preview=True)
-                    except Exception as e:
-                        await self.send_message(user_id, f"Error posting to `{channel_id}`: {e}")
-        except Exception:
+                post_id = delivery_post_id(user_id, batch_key, messages)
+                delivered = self.journal.delivered_channels(post_id)
+                await asyncio.gather(*(
+                    self.post_to_channel(user_id, channel_id, post_id, (poster, caption, footer_keyboard))
+                    for channel_id in user['post_channels'] if channel_id not in delivered
+                ))
+        except Exception as e:
             logger.exception(f"An error occurred in process_batch_task for user {user_id}")
+            error = repr(e)
         finally:
-            if user_id in self.batch_locks and batch_key in self.batch_locks.get(user_id, {}): del self.batch_locks[user_id][batch_key]
+            self.finish_batch_traces(window, batch_trace, reason, flushed_at, len(messages or []), error)
+            if messages is not None: self.journal.close_batch(user_id, batch_key, [m.id for m in messages])
+            # A file may have opened a new batch under the same key while this one was posting; keep its lock.
+            if batch_key not in self.file_batch.get(user_id, {}) and batch_key in self.batch_locks.get(user_id, {}): del self.batch_locks[user_id][batch_key]
             if user_id in self.file_batch and not self.file_batch.get(user_id, {}): del self.file_batch[user_id]
             if user_id in self.batch_locks and not self.batch_locks.get(user_id, {}): del self.batch_locks[user_id]
 
+    def finish_batch_traces(self, window, batch_trace, reason, flushed_at, files, error=None):
+        """Completes each file's trace with its wait in the batch window and the batch's own spans."""
+        attrs = {'batch_key': batch_trace.attrs['batch_key'], 'flush_reason': reason, 'batch_files': files}
+        if error: attrs['error'] = error
+        if not window['traces']:
+            # Batches restored from the journal carry no file traces; keep the batch's own
+            batch_trace.finish(**attrs)
+            return
+        for trace, added_at in window['traces']:
+            if flushed_at is not None:
+                trace.add_span('batch_window', added_at, flushed_at)
+            trace.spans.extend(batch_trace.spans)
+            trace.finish(**attrs)
+
+    async def post_to_channel(self, user_id, channel_id, post_id, post):
+        """
+        Sends one post to one post channel under that channel's token bucket.
+        FloodWait pauses the channel's bucket; other errors are retried with
+        exponential backoff. A successful send is recorded in the delivery ledger.
+        """
+        bucket = self.channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.channel_buckets[channel_id] = TokenBucket(Config.POST_CHANNEL_RATE, Config.POST_CHANNEL_BURST)
+        poster, caption, footer_keyboard = post
+        for attempt in range(1, Config.POST_MAX_RETRIES + 1):
+            await bucket.acquire()
+            try:
+                with span('send', channel=channel_id, attempt=attempt):
+                    sent = await send_post(self, channel_id, poster, caption, footer_keyboard)
+                self.journal.record_delivery(post_id, channel_id, sent.id if sent else None)
+                return
+            except FloodWait as e:
+                logger.warning(f"FloodWait of {e.value}s while posting to {channel_id}.")
+                record_floodwait('post', e.value)
+                bucket.penalize(e.value)
+                error = e
+            except (ChatWriteForbidden, ChannelPrivate, ChatAdminRequired, PeerIdInvalid) as e:
+                # The bot cannot post there at all; retrying will not help
+                error = e
+                break
+            except Exception as e:
+                error = e
+                if attempt < Config.POST_MAX_RETRIES:
+                    await asyncio.sleep(min(2 ** attempt, 60))
+        logger.error(f"Giving up on posting to {channel_id} for user {user_id}: {error}")
+        try:
+            await self.send_message(user_id, f"Error posting to `{channel_id}`: {error}")
+        except Exception:
+            logger.exception(f"Could not report a posting error to user {user_id}")
+
+    async def handle_metrics(self, request):
+        """Prometheus scrape endpoint for this bot process."""
+        return web.Response(body=render_metrics().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
     async def start_web_server(self):
-        self.web_app = web.Application()
-        self.web_app.router.add_get('/get/{file_unique_id}', handle_redirect)
-        self.web_runner = web.AppRunner(self.web_app)
+        self.web_app = create_app(self.redirector)
+        self.web_app.router.add_get('/metrics', self.handle_metrics)
+        self.web_runner = web.AppRunner(self.web_app, access_log=None)
         await self.web_runner.setup()
-        site = web.TCPSite(self.web_runner, Config.VPS_IP, Config.VPS_PORT)
+        # reuse_port lets extra `python -m features.redirector` workers share this port
+        site = web.TCPSite(self.web_runner, Config.VPS_IP, Config.VPS_PORT, reuse_port=True)
         await site.start()
         logger.info(f"Web redirector server started at http://{Config.VPS_IP}:{Config.VPS_PORT}")
 
-    async def start(self):
-        await super().start()
+    async def timed_phase(self, name, coro):
+        """Awaits one startup phase and records how long it took in startup_phases."""
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.startup_phases[name] = time.perf_counter() - started
+
+    async def log_in(self):
         self.me = await self.get_me()
         logger.info(f"Bot @{self.me.username} logged in.")
-        
-        await self.setup_database_channel()
+
+    async def start(self):
+        started = time.perf_counter()
+        start_parse_pool()
+        # Until restore_journal() is done, new files are journaled but not queued
+        self.held_files = []
+        # Caches are warm before the first update arrives
+        await self.timed_phase('load_snapshot', load_snapshot())
+        await self.timed_phase('connect', super().start())
+        self.http_session = create_http_session()
+        # Independent of each other; the Owner DB heartbeat no longer waits for index builds
+        await asyncio.gather(
+            self.timed_phase('get_me', self.log_in()),
+            self.timed_phase('ensure_indexes', ensure_indexes()),
+            self.timed_phase('load_channel_owners', load_channel_owners()),
+            self.timed_phase('setup_database_channel', self.setup_database_channel()),
+        )
+        self.journal.prune_deliveries(Config.DELIVERY_LEDGER_TTL)
+        await self.timed_phase('restore_journal', self.restore_journal())
         
         try:
             with open(Config.BOT_USERNAME_FILE, 'w') as f:
@@ -163,16 +433,49 @@ class Bot(Client):
             logger.info(f"Updated bot username to @{self.me.username} in {Config.BOT_USERNAME_FILE}")
         except Exception as e:
             logger.error(f"Could not write to {Config.BOT_USERNAME_FILE}. Error: {e}")
+        self.redirector.set_username(self.me.username)
         
-        asyncio.create_task(self.file_processor_worker())
-        await self.start_web_server()
-        logger.info(f"All services started successfully.")
+        self.worker_tasks = [
+            asyncio.create_task(self.file_processor_worker(worker_id))
+            for worker_id in range(len(self.file_queues))
+        ]
+        asyncio.create_task(self.throughput_reporter())
+        asyncio.create_task(backfill_file_fields())
+        asyncio.create_task(self.redirector.refresh_loop())
+        asyncio.create_task(monitor_loop_lag(Config.LOOP_LAG_INTERVAL))
+        if Config.CACHE_SNAPSHOT_FILE:
+            asyncio.create_task(snapshot_loop(Config.CACHE_SNAPSHOT_INTERVAL))
+        if Config.USER_CACHE_CHANGE_STREAM:
+            asyncio.create_task(watch_user_changes())
+        await asyncio.gather(
+            self.timed_phase('resume_broadcasts', resume_broadcasts(self)),
+            self.timed_phase('start_web_server', self.start_web_server()),
+        )
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_phases.items())
+        logger.info(f"All services started successfully in {time.perf_counter() - started:.2f}s ({phases}).")
 
     async def stop(self, *args):
         logger.info("Stopping bot and web server...")
         if self.web_runner:
             await self.web_runner.cleanup()
+        # Stop the workers first, so none adds a record to the buffer after it is closed;
+        # a file they were copying stays in the journal and is replayed on the next start
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        # Write out buffered file records and finish their files before the journal closes
+        await file_writes.close()
+        if self.pending_saves:
+            _, unfinished = await asyncio.wait(self.pending_saves, timeout=Config.FILE_WRITE_STOP_TIMEOUT)
+            if unfinished:
+                logger.warning(f"{len(unfinished)} files were not finished in time; they stay in the journal for the next start.")
+        if self.http_session:
+            await self.http_session.close()
+        await save_snapshot()
         await super().stop()
+        self.journal.close()
+        trace_exporter.close()
+        shutdown_parse_pool()
         logger.info("Bot stopped.")
 
 if __name__ == "__main__":
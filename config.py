@@ -12,3 +12,105 @@ class Config:
     BOT_USERNAME_FILE = "bot_username.txt"
     VPS_IP = os.environ.get("VPS_IP", "65.21.183.36")
     VPS_PORT = int(os.environ.get("VPS_PORT", 7071))
+
+    # Ingest worker pool. FILE_RATE_LIMIT is the shared copy rate (files/sec) for all workers.
+    FILE_WORKERS = int(os.environ.get("FILE_WORKERS", 4))
+    FILE_RATE_LIMIT = float(os.environ.get("FILE_RATE_LIMIT", 3))
+    FILE_RATE_BURST = int(os.environ.get("FILE_RATE_BURST", 5))
+    # Local SQLite journal that makes the ingest queue and open batches survive restarts
+    JOURNAL_FILE = os.environ.get("JOURNAL_FILE", "ingest_journal.db")
+
+    # Default batch window, overridable per owner from the settings menu.
+    # Each file extends the window by BATCH_IDLE_WINDOW seconds, up to BATCH_MAX_WAIT
+    # seconds after the first file; BATCH_MAX_SIZE files flush the batch immediately.
+    BATCH_IDLE_WINDOW = int(os.environ.get("BATCH_IDLE_WINDOW", 5))
+    BATCH_MAX_WAIT = int(os.environ.get("BATCH_MAX_WAIT", 120))
+    BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 20))
+
+    # IMDb poster cache. Misses are cached for a shorter time than hits.
+    POSTER_CACHE_SIZE = int(os.environ.get("POSTER_CACHE_SIZE", 2000))
+    POSTER_CACHE_TTL = int(os.environ.get("POSTER_CACHE_TTL", 7 * 24 * 3600))
+    POSTER_NEGATIVE_TTL = int(os.environ.get("POSTER_NEGATIVE_TTL", 6 * 3600))
+
+    # Shared HTTP client for IMDb and shortener calls (timeouts in seconds)
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 100))
+    HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", 10))
+    HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+    HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 10))
+    HTTP_TOTAL_TIMEOUT = float(os.environ.get("HTTP_TOTAL_TIMEOUT", 20))
+
+    # Shortened deep links, cached per owner and shortener domain
+    SHORTLINK_CACHE_SIZE = int(os.environ.get("SHORTLINK_CACHE_SIZE", 10000))
+    SHORTLINK_CACHE_TTL = int(os.environ.get("SHORTLINK_CACHE_TTL", 24 * 3600))
+
+    # get_user cache. Enable the change stream when several bot replicas share one database.
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 5000))
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 300))
+    USER_CACHE_CHANGE_STREAM = os.environ.get("USER_CACHE_CHANGE_STREAM", "false").lower() == "true"
+
+    # File search: only the newest SEARCH_CANDIDATES matches are ranked and paged, and the
+    # result count stops there too (shown as "1000+"). SEARCH_COUNT_LIMIT is the old name.
+    SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", os.environ.get("SEARCH_COUNT_LIMIT", 1000)))
+
+    # Per-owner file totals are updated on save; the TTL only corrects drift from outside writes
+    FILE_COUNT_CACHE_TTL = int(os.environ.get("FILE_COUNT_CACHE_TTL", 600))
+
+    # How often redirector processes pick up new file IDs and username changes (seconds)
+    REDIRECTOR_REFRESH_INTERVAL = int(os.environ.get("REDIRECTOR_REFRESH_INTERVAL", 15))
+    # Each refresh re-reads files saved this many seconds before the newest one it has seen, so
+    # writes that commit out of order (buffered or slow bulk writes) are not skipped
+    KNOWN_FILE_IDS_OVERLAP = int(os.environ.get("KNOWN_FILE_IDS_OVERLAP", 120))
+
+    # Broadcasts: global send budget (messages/sec), parallel sends, users per checkpoint
+    BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 25))
+    BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", 20))
+    BROADCAST_CHUNK_SIZE = int(os.environ.get("BROADCAST_CHUNK_SIZE", 500))
+    BROADCAST_MAX_RETRIES = int(os.environ.get("BROADCAST_MAX_RETRIES", 5))
+    BROADCAST_STATUS_INTERVAL = int(os.environ.get("BROADCAST_STATUS_INTERVAL", 15))
+
+    # Smart Backup: seconds between posts, posts prepared ahead of the sender, message IDs per get_messages call
+    BACKUP_POST_INTERVAL = float(os.environ.get("BACKUP_POST_INTERVAL", 3))
+    BACKUP_PREFETCH = int(os.environ.get("BACKUP_PREFETCH", 10))
+    BACKUP_FETCH_CHUNK = int(os.environ.get("BACKUP_FETCH_CHUNK", 200))
+    BACKUP_STATUS_INTERVAL = int(os.environ.get("BACKUP_STATUS_INTERVAL", 10))
+
+    # save_file_data write-behind: files per bulk_write and the longest a file waits for one (seconds).
+    # FILE_WRITE_BATCH_SIZE=1 writes every file on its own.
+    FILE_WRITE_BATCH_SIZE = int(os.environ.get("FILE_WRITE_BATCH_SIZE", 100))
+    FILE_WRITE_MAX_DELAY = float(os.environ.get("FILE_WRITE_MAX_DELAY", 0.2))
+    # On stop, how long to wait for buffered file records to finish before shutting down anyway (seconds)
+    FILE_WRITE_STOP_TIMEOUT = float(os.environ.get("FILE_WRITE_STOP_TIMEOUT", 30))
+
+    # Channels with no owner are remembered for this long before Mongo is asked again (seconds)
+    CHANNEL_ROUTE_NEGATIVE_SIZE = int(os.environ.get("CHANNEL_ROUTE_NEGATIVE_SIZE", 10000))
+    CHANNEL_ROUTE_NEGATIVE_TTL = int(os.environ.get("CHANNEL_ROUTE_NEGATIVE_TTL", 300))
+
+    # FSub: how long a confirmed membership is trusted, and how often a cached invite link is checked for revocation (seconds)
+    FSUB_MEMBER_CACHE_SIZE = int(os.environ.get("FSUB_MEMBER_CACHE_SIZE", 50000))
+    FSUB_MEMBER_CACHE_TTL = int(os.environ.get("FSUB_MEMBER_CACHE_TTL", 600))
+    FSUB_INVITE_CHECK_INTERVAL = int(os.environ.get("FSUB_INVITE_CHECK_INTERVAL", 3600))
+
+    # Post channel fan-out: per-channel send rate (posts/sec) and burst, attempts per channel, ledger retention (seconds)
+    POST_CHANNEL_RATE = float(os.environ.get("POST_CHANNEL_RATE", 0.3))
+    POST_CHANNEL_BURST = int(os.environ.get("POST_CHANNEL_BURST", 3))
+    POST_MAX_RETRIES = int(os.environ.get("POST_MAX_RETRIES", 5))
+    DELIVERY_LEDGER_TTL = int(os.environ.get("DELIVERY_LEDGER_TTL", 7 * 24 * 3600))
+
+    # Tracing: finished file traces go to TRACE_FILE as JSONL (empty disables the file); the latest
+    # TRACE_RECENT are kept for /traces. Traces or single spans over the thresholds are logged as slow (seconds).
+    TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+    TRACE_RECENT = int(os.environ.get("TRACE_RECENT", 1000))
+    TRACE_SLOW_SECONDS = float(os.environ.get("TRACE_SLOW_SECONDS", 600))
+    TRACE_SLOW_SPAN_SECONDS = float(os.environ.get("TRACE_SLOW_SPAN_SECONDS", 60))
+
+    # Worker processes that extract posters from IMDb pages off the event loop (0 parses inline),
+    # and how often the event loop lag is sampled for the event_loop_lag_seconds metric (seconds)
+    IMDB_PARSE_WORKERS = int(os.environ.get("IMDB_PARSE_WORKERS", 2))
+    LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.5))
+
+    # Warm start: in-process caches are saved to CACHE_SNAPSHOT_FILE every CACHE_SNAPSHOT_INTERVAL
+    # seconds and on stop, and loaded on start (empty disables the snapshot)
+    CACHE_SNAPSHOT_FILE = os.environ.get("CACHE_SNAPSHOT_FILE", "cache_snapshot.bin")
+    CACHE_SNAPSHOT_INTERVAL = int(os.environ.get("CACHE_SNAPSHOT_INTERVAL", 300))
@@ -0,0 +1,34 @@
+"""
+Fills in the derived fields of existing file records (search tokens, batch
+key, title, year, season, episode, quality) in batched bulk_writes. The bot
+runs the same backfill in the background on start; this command is for
+working through a large library up front, or for one owner:
+
+    python -m database.backfill [--owner USER_ID] [--batch-size 500]
+
+A full run saves its position after every batch and picks up from there if it
+is stopped. Files already at the current PARSER_VERSION are skipped.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from database.db import ensure_indexes, backfill_file_fields
+
+
+async def main(owner_id, batch_size):
+    await ensure_indexes()
+    started = time.perf_counter()
+    updated = await backfill_file_fields(owner_id, batch_size)
+    print(f"Updated {updated} files in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill parsed metadata and search tokens on file records.")
+    parser.add_argument("--owner", type=int, default=None, help="only this owner's files")
+    parser.add_argument("--batch-size", type=int, default=500, help="files per bulk_write")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.owner is None else logging.INFO, format="%(asctime)s %(message)s")
+    logging.getLogger("pymongo").setLevel(logging.WARNING)
+    asyncio.run(main(args.owner, args.batch_size))
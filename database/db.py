@@ -1,5 +1,17 @@
+import asyncio
+import datetime
+import logging
+import re
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
 from config import Config
+from utils.cache import TTLCache, MISSING
+from utils.parser import PARSER_VERSION, get_file_metadata
+from database.write_buffer import BulkWriteBuffer
+from utils.metrics import MONGO_CALL_SECONDS, instrument_module
+
+logger = logging.getLogger(__name__)
 
 client = AsyncIOMotorClient(Config.MONGO_URI)
 db = client[Config.DATABASE_NAME]
@@ -7,6 +19,68 @@ db = client[Config.DATABASE_NAME]
 users = db['users']
 files = db['files']
 bot_settings = db['bot_settings']
+poster_cache = db['poster_cache']
+shortlinks = db['shortlinks']
+broadcasts = db['broadcasts']
+backups = db['backups']
+
+RUNNING_BROADCASTS_QUERY = {'status': 'running'}
+STORAGE_OWNER_QUERY = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
+
+# Read-through cache for get_user. Every write to 'users' below invalidates the user's entry.
+user_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+# Bumped on every invalidation, so a read that raced a write does not cache the old document
+user_cache_generation = 0
+# Every stored file_unique_id, so the web redirector can 404 unknown IDs without a query.
+# Filled by load_known_file_ids() and kept current by save_file_data.
+known_file_ids = set()
+known_file_ids_state = {'loaded': False, 'saved_at': None}
+# Per-owner file totals for My Files, kept current by save_file_data
+file_count_cache = TTLCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.FILE_COUNT_CACHE_TTL)
+# Routing for new_file_handler: DB channel ID -> owner user_id, loaded by load_channel_owners()
+# and kept current by add_to_list/remove_from_list. Channels with no owner are cached negatively.
+channel_owners = {}
+unknown_channels = TTLCache(maxsize=Config.CHANNEL_ROUTE_NEGATIVE_SIZE, ttl=Config.CHANNEL_ROUTE_NEGATIVE_TTL)
+# File upserts from save_file_data, written in unordered bulk_writes
+file_writes = BulkWriteBuffer(files, Config.FILE_WRITE_BATCH_SIZE, Config.FILE_WRITE_MAX_DELAY)
+
+# Every index the bot relies on, as (collection, keys, options). Applied by ensure_indexes() on start.
+INDEXES = [
+    (users, [('user_id', 1)], {'unique': True}),
+    # find_owner_by_db_channel runs for every channel message; both feed the storage-owner $or
+    (users, [('db_channels', 1)], {}),
+    (users, [('post_channels', 1)], {}),
+    (files, [('file_unique_id', 1)], {}),
+    (files, [('owner_id', 1), ('file_unique_id', 1)], {'unique': True}),
+    # Owner listings are sorted newest first
+    (files, [('owner_id', 1), ('_id', -1)], {}),
+    # Incremental refreshes of known_file_ids
+    (files, [('saved_at', 1)], {}),
+    # Multikey token index behind search_user_files
+    (files, [('owner_id', 1), ('search_tokens', 1)], {}),
+    # Parsed metadata: grouping a library into posts, and lookups by title, episode or quality
+    (files, [('owner_id', 1), ('batch_key', 1), ('_id', 1)], {}),
+    (files, [('owner_id', 1), ('title', 1), ('year', 1), ('season', 1), ('episode', 1)], {}),
+    (files, [('owner_id', 1), ('quality', 1)], {}),
+    # Mongo drops cached posters on its own once 'expires_at' has passed
+    (poster_cache, [('expires_at', 1)], {'expireAfterSeconds': 0}),
+    (shortlinks, [('owner_id', 1), ('shortener_url', 1), ('long_url', 1)], {'unique': True}),
+    (broadcasts, [('status', 1)], {}),
+    # One Smart Backup checkpoint per owner and target channel
+    (backups, [('owner_id', 1), ('channel_id', 1)], {'unique': True}),
+]
+
+async def ensure_indexes():
+    """
+    Creates every index in INDEXES. Safe to run on every start: existing indexes
+    are left alone, and one that cannot be built (e.g. a unique index over
+    duplicate data) is logged without stopping the others.
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error(f"Could not create index {keys} on '{collection.name}': {e}")
 
 async def add_user(user_id):
     """Adds a new user to the database if they don't already exist."""
@@ -23,7 +97,10 @@ async def add_user(user_id):
         'shortener_enabled': True,
         'how_to_download_link': None
     }
-    await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    # A returning user is no longer blocked, so broadcasts reach them again
+    result = await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data, "$unset": {'blocked': ""}}, upsert=True)
+    if result.upserted_id is not None:
+        invalidate_user(user_id)
 
 # (The rest of the file is unchanged, providing for completeness)
 async def set_owner_db_channel(channel_id: int):
@@ -33,7 +110,17 @@ async def get_owner_db_channel():
     config = await bot_settings.find_one({'_id': 'owner_db_config'})
     return config.get('channel_id') if config else None
 
+def derived_file_fields(file_name):
+    """Everything stored on a file record that is computed from its name: search tokens and parsed metadata."""
+    from utils.helpers import get_search_tokens
+    return {'search_tokens': get_search_tokens(file_name or ''), **get_file_metadata(file_name)}
+
 async def save_file_data(owner_id, original_message, copied_message):
+    """
+    Queues the file's upsert on file_writes and returns once it is queued.
+    The returned task finishes when the write is done; it raises that file's
+    write error, if any.
+    """
     from utils.helpers import get_file_raw_link
     original_media = getattr(original_message, original_message.media.value)
     raw_link = await get_file_raw_link(copied_message)
@@ -43,84 +130,461 @@ async def save_file_data(owner_id, original_message, copied_message):
         'file_id': copied_message.id,
         'file_name': original_media.file_name,
         'file_size': original_media.file_size,
-        'raw_link': raw_link
+        'raw_link': raw_link,
+        **derived_file_fields(original_media.file_name)
     }
-    await files.update_one(
+    write = await file_writes.add(UpdateOne(
         {'owner_id': owner_id, 'file_unique_id': original_media.file_unique_id},
-        {'$set': file_data}, upsert=True
-    )
+        {'$set': file_data, '$currentDate': {'saved_at': True}}, upsert=True
+    ))
+    return asyncio.ensure_future(_file_saved(write, owner_id, original_media.file_unique_id))
+
+async def _file_saved(write, owner_id, file_unique_id):
+    if await write and owner_id in file_count_cache:
+        file_count_cache.set(owner_id, file_count_cache.get(owner_id) + 1)
+    known_file_ids.add(file_unique_id)
 
 async def get_user(user_id):
-    return await users.find_one({'user_id': user_id})
+    """Returns the user's settings document. Served from user_cache when possible; treat it as read-only."""
+    user = user_cache.get(user_id)
+    if user is MISSING:
+        generation = user_cache_generation
+        with MONGO_CALL_SECONDS.time(function='get_user'):
+            user = await users.find_one({'user_id': user_id})
+        if generation == user_cache_generation:
+            user_cache.set(user_id, user)
+    return user
+
+def invalidate_user(user_id=None):
+    """Drops one user (or, with no argument, every user) from user_cache."""
+    global user_cache_generation
+    user_cache_generation += 1
+    if user_id is None:
+        user_cache.clear()
+    else:
+        user_cache.pop(user_id)
+
+def get_user_cache_stats():
+    return {'hits': user_cache.hits, 'misses': user_cache.misses, 'size': len(user_cache)}
+
+async def watch_user_changes():
+    """
+    Follows a change stream on 'users' and invalidates cached entries (and
+    channel routes) changed by other bot replicas. Needs a replica set (Atlas
+    has one); reconnects on errors.
+    """
+    reconnecting = False
+    while True:
+        try:
+            async with users.watch(full_document='updateLookup') as stream:
+                logger.info("Watching 'users' change stream for cache invalidation.")
+                # Catch up on routes changed while the stream was down
+                if reconnecting: await load_channel_owners()
+                async for change in stream:
+                    document = change.get('fullDocument') or {}
+                    user_id = document.get('user_id')
+                    # Deletes carry no document; drop everything rather than guess
+                    invalidate_user(user_id)
+                    if user_id is None:
+                        await load_channel_owners()
+                    else:
+                        set_owner_channels(user_id, document.get('db_channels', []))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"User change stream stopped ({e}). Reconnecting in 30s.")
+            reconnecting = True
+            invalidate_user()
+            await asyncio.sleep(30)
 
 async def get_all_user_ids(storage_owners_only=False):
     query = {}
     if storage_owners_only:
-        query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
+        query = STORAGE_OWNER_QUERY
     cursor = users.find(query, {'user_id': 1})
     return [doc['user_id'] for doc in await cursor.to_list(length=None) if 'user_id' in doc]
 
 async def get_storage_owner_ids():
-    query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
-    cursor = users.find(query, {'user_id': 1})
+    cursor = users.find(STORAGE_OWNER_QUERY, {'user_id': 1})
     return [doc['user_id'] for doc in await cursor.to_list(length=None) if 'user_id' in doc]
 
 async def get_normal_user_ids():
     all_users_cursor = users.find({}, {'user_id': 1})
-    storage_owners_cursor = users.find({"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}, {'user_id': 1})
+    storage_owners_cursor = users.find(STORAGE_OWNER_QUERY, {'user_id': 1})
     all_user_ids = {doc['user_id'] for doc in await all_users_cursor.to_list(length=None) if 'user_id' in doc}
     storage_owner_ids = {doc['user_id'] for doc in await storage_owners_cursor.to_list(length=None) if 'user_id' in doc}
     return list(all_user_ids - storage_owner_ids)
 
 async def get_storage_owners_count():
-    query = {"$or": [{"post_channels": {"$exists": True, "$ne": []}}, {"db_channels": {"$exists": True, "$ne": []}}]}
-    return await users.count_documents(query)
+    return await users.count_documents(STORAGE_OWNER_QUERY)
 
 async def update_user(user_id, key, value):
     await users.update_one({'user_id': user_id}, {'$set': {key: value}}, upsert=True)
+    invalidate_user(user_id)
 
 async def add_to_list(user_id, list_name, item):
     await users.update_one({'user_id': user_id}, {'$addToSet': {list_name: item}})
+    invalidate_user(user_id)
+    if list_name == 'db_channels':
+        channel_owners.setdefault(item, user_id)
+        unknown_channels.pop(item)
 
 async def remove_from_list(user_id, list_name, item):
     await users.update_one({'user_id': user_id}, {'$pull': {list_name: item}})
+    invalidate_user(user_id)
+    if list_name == 'db_channels' and channel_owners.get(item) == user_id:
+        del channel_owners[item]
+
+async def load_channel_owners():
+    """Builds the channel -> owner routing map from every owner with DB channels. Called on start."""
+    routes = {}
+    async for user in users.find({'db_channels': {'$exists': True, '$ne': []}}, {'user_id': 1, 'db_channels': 1}):
+        for channel_id in user['db_channels']:
+            routes.setdefault(channel_id, user['user_id'])
+    channel_owners.clear()
+    channel_owners.update(routes)
+    unknown_channels.clear()
+    logger.info(f"Loaded routing for {len(channel_owners)} DB channels.")
+
+def set_owner_channels(user_id, db_channels):
+    """Replaces one owner's routes, e.g. after another replica changed them."""
+    for channel_id in [channel_id for channel_id, owner in channel_owners.items() if owner == user_id]:
+        del channel_owners[channel_id]
+    for channel_id in db_channels:
+        channel_owners.setdefault(channel_id, user_id)
+        unknown_channels.pop(channel_id)
 
 async def find_owner_by_db_channel(channel_id):
-    user = await users.find_one({'db_channels': channel_id})
-    return user['user_id'] if user else None
+    """
+    Owner of a DB channel, from the routing map. A channel missing from the map
+    is looked up once (it may have been added by another process) and, if it
+    has no owner, remembered as unknown for CHANNEL_ROUTE_NEGATIVE_TTL seconds.
+    """
+    owner_id = channel_owners.get(channel_id)
+    if owner_id is not None or channel_id in unknown_channels:
+        return owner_id
+    with MONGO_CALL_SECONDS.time(function='find_owner_by_db_channel'):
+        user = await users.find_one({'db_channels': channel_id}, {'user_id': 1})
+    if user:
+        channel_owners[channel_id] = user['user_id']
+        return user['user_id']
+    unknown_channels.set(channel_id, True)
+    return None
+
+def known_file_ids_query(newest=None):
+    if newest is None:
+        return {}
+    return {'saved_at': {'$gte': newest - datetime.timedelta(seconds=Config.KNOWN_FILE_IDS_OVERLAP)}}
+
+async def load_known_file_ids():
+    """
+    Adds the file_unique_id of every file saved since the last call to
+    known_file_ids; the first call loads them all. Files are found by
+    'saved_at', stamped by the server on every write, going back
+    KNOWN_FILE_IDS_OVERLAP seconds from the newest one seen: an _id or
+    timestamp cursor alone skips files whose write became visible after a
+    later one. Returns the number of IDs added.
+    """
+    newest = known_file_ids_state['saved_at']
+    before = len(known_file_ids)
+    async for doc in files.find(known_file_ids_query(newest), {'_id': 0, 'file_unique_id': 1, 'saved_at': 1}):
+        known_file_ids.add(doc['file_unique_id'])
+        saved_at = doc.get('saved_at')
+        if saved_at is not None and (newest is None or saved_at > newest):
+            newest = saved_at
+    # Files saved before 'saved_at' existed have none; start the next window from now
+    known_file_ids_state['saved_at'] = newest or datetime.datetime.utcnow()
+    known_file_ids_state['loaded'] = True
+    return len(known_file_ids) - before
+
+def is_known_file_id(file_unique_id: str):
+    """True if the file exists, or if the ID set has not been loaded yet."""
+    return not known_file_ids_state['loaded'] or file_unique_id in known_file_ids
 
 async def get_file_by_unique_id(file_unique_id: str):
     return await files.find_one({'file_unique_id': file_unique_id})
 
 async def get_user_file_count(owner_id):
-    return await files.count_documents({'owner_id': owner_id})
+    count = file_count_cache.get(owner_id)
+    if count is MISSING:
+        with MONGO_CALL_SECONDS.time(function='get_user_file_count'):
+            count = await files.count_documents({'owner_id': owner_id})
+        file_count_cache.set(owner_id, count)
+    return count
+
+def backup_query(owner_id, after_key=None, last=None):
+    """
+    An owner's named files after batch key `after_key`. `last` is the
+    (batch_key, _id) of the last file already read, for the next page of
+    iter_backup_batches.
+    """
+    query = {'owner_id': owner_id, 'file_name': {'$nin': [None, '']}}
+    if after_key is not None:
+        query['batch_key'] = {'$gt': after_key}
+    if last is not None:
+        last_key, last_id = last
+        query['batch_key'] = {'$gte': last_key}
+        query['$or'] = [{'batch_key': {'$gt': last_key}}, {'_id': {'$gt': last_id}}]
+    return query
+
+async def iter_backup_batches(owner_id, after_key=None, page_size: int = 1000):
+    """
+    Streams an owner's files grouped into posts, as (batch_key, [file_id, ...])
+    in batch key order, starting after `after_key`. Reads the (owner_id,
+    batch_key, _id) index in pages of `page_size` files, each a new query from
+    the last file read: a backup is paced by the post rate, and one cursor kept
+    open for all of it would be killed by the server's idle cursor timeout.
+    """
+    batch_key, file_ids = None, []
+    last = None
+    while True:
+        page = await files.find(backup_query(owner_id, after_key, last), {'batch_key': 1, 'file_id': 1}).sort([('batch_key', 1), ('_id', 1)]).limit(page_size).to_list(length=page_size)
+        for doc in page:
+            if file_ids and doc['batch_key'] != batch_key:
+                yield batch_key, file_ids
+                file_ids = []
+            batch_key = doc['batch_key']
+            file_ids.append(doc['file_id'])
+        if len(page) < page_size:
+            break
+        last = (page[-1]['batch_key'], page[-1]['_id'])
+    if file_ids:
+        yield batch_key, file_ids
+
+async def count_backup_batches(owner_id, after_key=None):
+    pipeline = [
+        {'$match': backup_query(owner_id, after_key)},
+        {'$group': {'_id': '$batch_key'}},
+        {'$count': 'batches'}
+    ]
+    result = await files.aggregate(pipeline).to_list(length=1)
+    return result[0]['batches'] if result else 0
+
+def paginated_files_query(user_id, cursor=None, direction: str = 'next'):
+    query = {'owner_id': user_id}
+    if cursor is not None:
+        query['_id'] = {'$lt' if direction == 'next' else '$gt': cursor}
+    return query
+
+async def get_paginated_files(user_id, cursor=None, direction: str = 'next', page_size: int = 5):
+    """
+    Keyset pagination over an owner's files, newest first. `cursor` is the _id
+    of the last file of the current page (direction 'next') or its first file
+    ('prev'). Returns (files, more): `more` tells if another page exists in that direction.
+    """
+    order = -1 if direction == 'next' else 1
+    docs = await files.find(paginated_files_query(user_id, cursor, direction)).sort('_id', order).limit(page_size + 1).to_list(length=page_size + 1)
+    more = len(docs) > page_size
+    docs = docs[:page_size]
+    if direction == 'prev': docs.reverse()
+    return docs, more
+
+def search_filter(user_id, query: str):
+    """
+    The match behind search_user_files: every query word must be a token of the
+    file name, except the last one, which matches as a prefix. Returns
+    (filter, last word), or (None, None) for a query with no words.
+    """
+    from utils.helpers import get_query_tokens
+    exact_tokens, prefix_token = get_query_tokens(query)
+    if not exact_tokens and not prefix_token: return None, None
+    conditions = [{'owner_id': user_id}]
+    if exact_tokens:
+        conditions.append({'search_tokens': {'$all': exact_tokens}})
+    if prefix_token:
+        conditions.append({'search_tokens': {'$regex': f"^{re.escape(prefix_token)}"}})
+    return {'$and': conditions}, prefix_token or exact_tokens[-1]
 
-async def get_all_user_files(user_id):
-    return files.find({'owner_id': user_id})
+async def search_user_files(user_id, query: str, cursor=None, direction: str = 'next', page_size: int = 5, with_total: bool = True):
+    """
+    Searches an owner's files through the 'search_tokens' index (see search_filter).
+    Results are ranked (exact last word first, then shorter names, then newest)
+    among the newest SEARCH_CANDIDATES matches. The total is counted up to the
+    same cap, so every counted file can be reached from the pages; it is
+    skipped with `with_total=False`.
 
-async def get_paginated_files(user_id, page: int, page_size: int = 5):
-    skip = (page - 1) * page_size
-    cursor = files.find({'owner_id': user_id}).sort('_id', -1).skip(skip).limit(page_size)
-    return await cursor.to_list(length=page_size)
+    Pages are keyset-based like get_paginated_files; `cursor` is the
+    (exact, token_count, _id) rank of the edge file of the current page.
+    Returns (files, total, more).
+    """
+    match, last_word = search_filter(user_id, query)
+    if match is None: return [], 0, False
 
-async def search_user_files(user_id, query: str, page: int, page_size: int = 5):
-    search_filter = {'owner_id': user_id, 'file_name': {'$regex': query, '$options': 'i'}}
-    skip = (page - 1) * page_size
-    total_files = await files.count_documents(search_filter)
-    cursor = files.find(search_filter).sort('_id', -1).skip(skip).limit(page_size)
-    files_list = await cursor.to_list(length=page_size)
-    return files_list, total_files
+    total_files = await files.count_documents(match, limit=Config.SEARCH_CANDIDATES) if with_total else None
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'_id': -1}},
+        {'$limit': Config.SEARCH_CANDIDATES},
+        {'$addFields': {
+            'exact': {'$in': [last_word, '$search_tokens']},
+            'token_count': {'$size': '$search_tokens'}
+        }}
+    ]
+    forward = direction == 'next'
+    if cursor is not None:
+        exact, token_count, _id = cursor
+        # Rank order is (exact desc, token_count asc, _id desc); 'prev' walks it backwards
+        pipeline.append({'$match': {'$or': [
+            {'exact': {'$lt' if forward else '$gt': exact}},
+            {'exact': exact, 'token_count': {'$gt' if forward else '$lt': token_count}},
+            {'exact': exact, 'token_count': token_count, '_id': {'$lt' if forward else '$gt': _id}}
+        ]}})
+    order = 1 if forward else -1
+    pipeline += [
+        {'$sort': {'exact': -order, 'token_count': order, '_id': -order}},
+        {'$limit': page_size + 1}
+    ]
+    files_list = await files.aggregate(pipeline).to_list(length=page_size + 1)
+    more = len(files_list) > page_size
+    files_list = files_list[:page_size]
+    if not forward: files_list.reverse()
+    return files_list, total_files, more
+
+async def backfill_file_fields(owner_id=None, batch_size: int = 500):
+    """
+    Recomputes search tokens and parsed metadata for files saved before those
+    fields existed or under an older PARSER_VERSION, with one bulk_write per
+    batch. A full run checkpoints its position in bot_settings and resumes from
+    it; `owner_id` limits the run to one owner. Returns the number of files updated.
+    """
+    query = {'meta_version': {'$ne': PARSER_VERSION}}
+    last_id = None
+    if owner_id is not None:
+        query['owner_id'] = owner_id
+    else:
+        checkpoint = await bot_settings.find_one({'_id': 'file_fields_backfill'})
+        if checkpoint and checkpoint.get('version') == PARSER_VERSION:
+            last_id = checkpoint.get('last_id')
+    updated = 0
+    while True:
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        cursor = files.find(query, {'file_name': 1}).sort('_id', 1).limit(batch_size)
+        docs = await cursor.to_list(length=batch_size)
+        if not docs: break
+        await files.bulk_write([
+            UpdateOne({'_id': doc['_id']}, {'$set': derived_file_fields(doc.get('file_name'))})
+            for doc in docs
+        ], ordered=False)
+        updated += len(docs)
+        last_id = docs[-1]['_id']
+        if owner_id is None:
+            await bot_settings.update_one(
+                {'_id': 'file_fields_backfill'},
+                {'$set': {'version': PARSER_VERSION, 'last_id': last_id}}, upsert=True
+            )
+            logger.debug(f"Backfilled file fields for {updated} files so far.")
+    if updated:
+        logger.info(f"Backfilled file fields for {updated} files.")
+    return updated
 
 async def total_users_count():
-    return await users.count_documents({})
+    return await users.estimated_document_count()
 
 async def add_footer_button(user_id, button_name, button_url):
     button = {'name': button_name, 'url': button_url}
     await users.update_one({'user_id': user_id}, {'$push': {'footer_buttons': button}})
+    invalidate_user(user_id)
 
 async def remove_footer_button(user_id, button_name):
     await users.update_one({'user_id': user_id}, {'$pull': {'footer_buttons': {'name': button_name}}})
+    invalidate_user(user_id)
 
 async def delete_all_files():
     result = await files.delete_many({})
+    file_count_cache.clear()
+    known_file_ids.clear()
     return result.deleted_count
+
+async def get_cached_poster(key: str):
+    """Returns the cached poster document for a normalized title key, or None if absent or expired."""
+    return await poster_cache.find_one({'_id': key, 'expires_at': {'$gt': datetime.datetime.utcnow()}})
+
+async def set_cached_poster(key: str, poster_url, ttl: int):
+    """Caches a poster URL (or None for a miss) for `ttl` seconds."""
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+    await poster_cache.update_one({'_id': key}, {'$set': {'poster_url': poster_url, 'expires_at': expires_at}}, upsert=True)
+
+async def set_cached_poster_file_id(key: str, file_id):
+    """Stores the Telegram file_id of an uploaded poster next to its URL; the entry keeps its expiry."""
+    await poster_cache.update_one({'_id': key}, {'$set': {'file_id': file_id}})
+
+def shortlink_query(owner_id, shortener_url: str, long_url: str):
+    return {'owner_id': owner_id, 'shortener_url': shortener_url, 'long_url': long_url}
+
+async def get_cached_shortlink(owner_id, shortener_url: str, long_url: str):
+    doc = await shortlinks.find_one(shortlink_query(owner_id, shortener_url, long_url))
+    return doc['short_url'] if doc else None
+
+async def set_cached_shortlink(owner_id, shortener_url: str, long_url: str, short_url: str):
+    await shortlinks.update_one(
+        shortlink_query(owner_id, shortener_url, long_url),
+        {'$set': {'short_url': short_url}}, upsert=True
+    )
+
+async def delete_cached_shortlinks(owner_id):
+    """Drops every cached shortlink of an owner, e.g. after they change their shortener."""
+    await shortlinks.delete_many({'owner_id': owner_id})
+
+def broadcast_query(target: str):
+    """Recipients of a broadcast to 'all', 'storage' owners or 'normal' users, minus users flagged as blocked."""
+    query = {'blocked': {'$ne': True}}
+    if target == 'storage':
+        query.update(STORAGE_OWNER_QUERY)
+    elif target == 'normal':
+        query['$nor'] = STORAGE_OWNER_QUERY['$or']
+    return query
+
+def broadcast_recipients_query(target: str, after_user_id=None):
+    query = broadcast_query(target)
+    if after_user_id is not None:
+        query['user_id'] = {'$gt': after_user_id}
+    return query
+
+async def count_broadcast_users(target: str):
+    return await users.count_documents(broadcast_query(target))
+
+async def get_broadcast_user_ids(target: str, after_user_id=None, limit: int = 500):
+    """Next chunk of recipient IDs in user_id order, so a broadcast can resume from a checkpoint."""
+    cursor = users.find(broadcast_recipients_query(target, after_user_id), {'user_id': 1}).sort('user_id', 1).limit(limit)
+    return [doc['user_id'] for doc in await cursor.to_list(length=limit)]
+
+async def mark_users_blocked(user_ids):
+    """Flags users who blocked the bot or deleted their account; later broadcasts skip them."""
+    if user_ids:
+        await users.update_many({'user_id': {'$in': list(user_ids)}}, {'$set': {'blocked': True}})
+
+async def create_broadcast(job: dict):
+    result = await broadcasts.insert_one(job)
+    return result.inserted_id
+
+async def get_broadcast(job_id):
+    return await broadcasts.find_one({'_id': job_id})
+
+async def update_broadcast(job_id, fields: dict):
+    await broadcasts.update_one({'_id': job_id}, {'$set': fields})
+
+async def get_running_broadcasts():
+    return await broadcasts.find(RUNNING_BROADCASTS_QUERY).to_list(length=None)
+
+def backup_checkpoint_query(owner_id, channel_id):
+    return {'owner_id': owner_id, 'channel_id': channel_id}
+
+async def get_backup_checkpoint(owner_id, channel_id):
+    return await backups.find_one(backup_checkpoint_query(owner_id, channel_id))
+
+async def save_backup_checkpoint(owner_id, channel_id, fields: dict):
+    fields = dict(fields, updated_at=datetime.datetime.utcnow())
+    await backups.update_one(backup_checkpoint_query(owner_id, channel_id), {'$set': fields}, upsert=True)
+
+# Every coroutine above is timed in mongo_call_seconds{function=...}, except:
+# - the functions fronted by an in-process cache, which time only their Mongo
+#   query on a miss, so cache hits do not hide real database latency;
+# - save_file_data and _file_saved, which only queue into and wait on file_writes
+#   (the bulk_write itself is timed there);
+# - the change stream watcher and the backfill, which run for minutes or the
+#   bot's lifetime and would only skew the histogram.
+instrument_module(globals(), MONGO_CALL_SECONDS, 'function', exclude=(
+    'get_user', 'find_owner_by_db_channel', 'get_user_file_count',
+    'save_file_data', '_file_saved', 'watch_user_changes', 'backfill_file_fields',
+))
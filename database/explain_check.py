@@ -0,0 +1,98 @@
+"""
+Runs explain() on the query behind each hot function in database/db.py and
+fails if any of them falls back to a COLLSCAN. Point it at a disposable
+local mongod, since it applies the index registry and seeds a few documents:
+
+    MONGO_URI=mongodb://localhost:27017 DATABASE_NAME=explain_check python -m database.explain_check
+
+Full-collection listings (get_all_user_ids, get_normal_user_ids) read every
+user by design and are not checked.
+"""
+import asyncio
+import datetime
+import sys
+
+from bson import ObjectId
+
+from database.db import (
+    db, users, files, shortlinks, broadcasts, backups, ensure_indexes,
+    STORAGE_OWNER_QUERY, RUNNING_BROADCASTS_QUERY, backup_query, paginated_files_query, search_filter,
+    broadcast_recipients_query, shortlink_query, backup_checkpoint_query, known_file_ids_query
+)
+from utils.helpers import get_search_tokens
+
+# (db.py function, collection, filter, sort). Filters come from db.py's own
+# builders, so a change there is checked here; single-field lookups are spelled out.
+QUERY_SHAPES = [
+    ("get_user", users, {'user_id': 1}, None),
+    ("update_user/add_to_list/remove_from_list", users, {'user_id': 1}, None),
+    ("find_owner_by_db_channel", users, {'db_channels': -1001}, None),
+    ("get_storage_owner_ids/get_storage_owners_count", users, STORAGE_OWNER_QUERY, None),
+    ("get_file_by_unique_id", files, {'file_unique_id': 'uid1'}, None),
+    ("save_file_data", files, {'owner_id': 1, 'file_unique_id': 'uid1'}, None),
+    ("get_user_file_count", files, {'owner_id': 1}, None),
+    ("load_known_file_ids (refresh)", files, known_file_ids_query(datetime.datetime.utcnow()), None),
+    ("get_paginated_files", files, paginated_files_query(1), [('_id', -1)]),
+    ("get_paginated_files (next page)", files, paginated_files_query(1, ObjectId()), [('_id', -1)]),
+    ("iter_backup_batches", files, backup_query(1, 'a'), [('batch_key', 1), ('_id', 1)]),
+    ("iter_backup_batches (next page)", files, backup_query(1, 'a', ('show', ObjectId())), [('batch_key', 1), ('_id', 1)]),
+    ("count_backup_batches", files, backup_query(1), None),
+    # The $match/$sort/$limit head of the search pipeline; the ranking stages only see its candidates
+    ("search_user_files", files, search_filter(1, "show 72")[0], [('_id', -1)]),
+    ("get_broadcast_user_ids (all)", users, broadcast_recipients_query('all', 5), [('user_id', 1)]),
+    ("get_broadcast_user_ids (storage)", users, broadcast_recipients_query('storage', 5), [('user_id', 1)]),
+    ("get_broadcast_user_ids (normal)", users, broadcast_recipients_query('normal', 5), [('user_id', 1)]),
+    ("get_running_broadcasts", broadcasts, RUNNING_BROADCASTS_QUERY, None),
+    ("get_cached_shortlink/set_cached_shortlink", shortlinks, shortlink_query(1, 'https://short.example', 'https://t.me/x'), None),
+    ("get_backup_checkpoint/save_backup_checkpoint", backups, backup_checkpoint_query(1, -2001), None),
+]
+
+def plan_stages(plan):
+    """Yields every stage name in an explain plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+async def seed():
+    for user_id in range(1, 21):
+        await users.update_one(
+            {'user_id': user_id},
+            {'$set': {'post_channels': [-2000 - user_id] if user_id % 2 else [], 'db_channels': [-1000 - user_id]}},
+            upsert=True
+        )
+    for n in range(200):
+        await files.update_one(
+            {'owner_id': n % 20 + 1, 'file_unique_id': f'uid{n}'},
+            {'$set': {'file_name': f'Show S01E{n:02d} 720p.mkv', 'file_id': n, 'batch_key': 'show',
+                      'search_tokens': get_search_tokens(f'Show S01E{n:02d} 720p.mkv')}},
+            upsert=True
+        )
+
+
+async def main():
+    await ensure_indexes()
+    await seed()
+    failures = 0
+    for name, collection, query, sort in QUERY_SHAPES:
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = set(plan_stages(explain['queryPlanner']['winningPlan']))
+        status = "FAIL" if 'COLLSCAN' in stages else "ok"
+        failures += status == "FAIL"
+        print(f"[{status:>4}] {name:<48} {' > '.join(sorted(stages))}")
+    print(f"\n{len(QUERY_SHAPES) - failures}/{len(QUERY_SHAPES)} queries use an index.")
+    return failures
+
+
+if __name__ == "__main__":
+    if db.name == 'telegram_bot':
+        sys.exit("Refusing to seed the production database; set DATABASE_NAME to a scratch database.")
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+
+class IngestJournal:
+    """
+    A local SQLite journal behind the in-memory file queues.
+    Queued files are written here before they reach a worker and acked once
+    save_file_data has stored them; open batches are kept with their deadline,
+    and every post sent to a post channel is recorded in a delivery ledger.
+    On startup the bot replays whatever is left.
+    """
+
+    def __init__(self, path: str):
+        # Autocommit + WAL keeps every write a single sub-millisecond append
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "job_id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, owner_id INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "owner_id INTEGER NOT NULL, batch_key TEXT NOT NULL, message_id INTEGER NOT NULL, "
+            "deadline REAL NOT NULL, PRIMARY KEY (owner_id, batch_key, message_id))"
+        )
+        # Delivery ledger: which post channels already have a given post, so retries never post twice
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            "post_id TEXT NOT NULL, channel_id INTEGER NOT NULL, message_id INTEGER, "
+            "delivered_at REAL NOT NULL, PRIMARY KEY (post_id, channel_id))"
+        )
+
+    def enqueue(self, chat_id, message_id, owner_id):
+        cursor = self.conn.execute(
+            "INSERT INTO queue (chat_id, message_id, owner_id, created_at) VALUES (?, ?, ?, ?)",
+            (chat_id, message_id, owner_id, time.time())
+        )
+        return cursor.lastrowid
+
+    def ack(self, job_id):
+        self.conn.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+
+    def pending(self):
+        """Returns (job_id, chat_id, message_id, owner_id) for every unacked file, oldest first."""
+        return self.conn.execute("SELECT job_id, chat_id, message_id, owner_id FROM queue ORDER BY job_id").fetchall()
+
+    def add_batch_file(self, owner_id, batch_key, message_id, deadline):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO batches (owner_id, batch_key, message_id, deadline) VALUES (?, ?, ?, ?)",
+            (owner_id, batch_key, message_id, deadline)
+        )
+
+    def close_batch(self, owner_id, batch_key, message_ids=None):
+        """Drops a posted batch. With `message_ids`, only those files are dropped, leaving a newer batch under the same key intact."""
+        if message_ids is None:
+            self.conn.execute("DELETE FROM batches WHERE owner_id = ? AND batch_key = ?", (owner_id, batch_key))
+        else:
+            self.conn.executemany(
+                "DELETE FROM batches WHERE owner_id = ? AND batch_key = ? AND message_id = ?",
+                [(owner_id, batch_key, message_id) for message_id in message_ids]
+            )
+
+    def open_batches(self):
+        """Returns {(owner_id, batch_key): (deadline, [message_ids])} for batches that were never posted."""
+        batches = {}
+        for owner_id, batch_key, message_id, deadline in self.conn.execute(
+            "SELECT owner_id, batch_key, message_id, deadline FROM batches ORDER BY rowid"
+        ):
+            entry = batches.setdefault((owner_id, batch_key), [deadline, []])
+            entry[0] = max(entry[0], deadline)
+            entry[1].append(message_id)
+        return {key: (deadline, ids) for key, (deadline, ids) in batches.items()}
+
+    def delivered_channels(self, post_id):
+        return {row[0] for row in self.conn.execute("SELECT channel_id FROM deliveries WHERE post_id = ?", (post_id,))}
+
+    def record_delivery(self, post_id, channel_id, message_id):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO deliveries (post_id, channel_id, message_id, delivered_at) VALUES (?, ?, ?, ?)",
+            (post_id, channel_id, message_id, time.time())
+        )
+
+    def prune_deliveries(self, max_age: float):
+        """Forgets deliveries older than `max_age` seconds; no retry or replay reaches that far back."""
+        self.conn.execute("DELETE FROM deliveries WHERE delivered_at < ?", (time.time() - max_age,))
+
+    def close(self):
+        self.conn.close()
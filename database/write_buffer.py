@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from pymongo.errors import BulkWriteError, WriteError
+from utils.metrics import MONGO_CALL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriteBuffer:
+    """
+    Write-behind buffer for one collection. Queued operations are sent as one
+    unordered bulk_write once `max_ops` are waiting or the oldest has waited
+    `max_delay` seconds. Each add() returns a future for that operation alone:
+    it resolves to True if the operation upserted a new document (False
+    otherwise), or raises the WriteError Mongo reported for that item.
+    """
+
+    def __init__(self, collection, max_ops: int = 100, max_delay: float = 0.2):
+        self.collection = collection
+        self.max_ops = max(1, max_ops)
+        self.max_delay = max_delay
+        self.pending = []
+        self.timer = None
+        self.closed = False
+        # One bulk_write at a time, so two upserts of the same key never race each other
+        self.lock = asyncio.Lock()
+        self.stats = {'flushes': 0, 'ops': 0, 'errors': 0}
+
+    async def add(self, operation):
+        """Queues one operation. When the buffer is full, waits for the flush (backpressure)."""
+        if self.closed:
+            raise RuntimeError("The write buffer is closed.")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((operation, future))
+        if len(self.pending) >= self.max_ops:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_later())
+        return future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Writes everything queued so far. The write runs in its own task: a caller
+        cancelled while waiting (e.g. a worker stopped on shutdown) does not abort
+        it, so every future of the batch is still resolved.
+        """
+        if self.timer is not None and self.timer is not asyncio.current_task():
+            self.timer.cancel()
+            self.timer = None
+        await asyncio.shield(asyncio.ensure_future(self._write_pending()))
+
+    async def _write_pending(self):
+        async with self.lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return
+            self.stats['flushes'] += 1
+            self.stats['ops'] += len(batch)
+            upserted, errors = set(), {}
+            try:
+                with MONGO_CALL_SECONDS.time(function=f"bulk_write:{self.collection.name}"):
+                    result = await self.collection.bulk_write([operation for operation, _ in batch], ordered=False)
+                upserted = set(result.upserted_ids)
+            except BulkWriteError as e:
+                upserted = {item['index'] for item in e.details.get('upserted', [])}
+                errors = {item['index']: item for item in e.details.get('writeErrors', [])}
+            except Exception as e:
+                # The whole batch failed (network, auth...): every item gets the error
+                self.stats['errors'] += len(batch)
+                logger.warning(f"Bulk write of {len(batch)} operations failed: {e}")
+                for _, future in batch:
+                    if not future.done(): future.set_exception(e)
+                return
+            self.stats['errors'] += len(errors)
+            for index, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in errors:
+                    error = errors[index]
+                    future.set_exception(WriteError(error.get('errmsg'), error.get('code'), error))
+                else:
+                    future.set_result(index in upserted)
+
+    async def close(self):
+        """Stops accepting operations and flushes the rest. Called on shutdown."""
+        self.closed = True
+        await self.flush()
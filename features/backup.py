@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import FloodWait
+from config import Config
+from database.db import (
+    iter_backup_batches, count_backup_batches, backfill_file_fields,
+    get_backup_checkpoint, save_backup_checkpoint
+)
+from features.poster import send_post
+from utils.helpers import create_post
+from utils.metrics import record_floodwait
+from utils.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Posts that could not be prepared; the sender reports them and moves on
+PREPARE_FAILED = object()
+# Queued by the producer instead of the end marker when reading the file list failed
+PREFETCH_FAILED = object()
+
+
+class BackupInterrupted(Exception):
+    """The backup stopped before the end of the file list; its checkpoint stays resumable."""
+
+async def fetch_messages(client, chat_id, message_ids):
+    """get_messages in chunks of BACKUP_FETCH_CHUNK IDs, waiting out FloodWaits. Deleted messages are dropped."""
+    messages = []
+    for start in range(0, len(message_ids), Config.BACKUP_FETCH_CHUNK):
+        chunk = message_ids[start:start + Config.BACKUP_FETCH_CHUNK]
+        while True:
+            try:
+                fetched = await client.get_messages(chat_id, chunk)
+                break
+            except FloodWait as e:
+                record_floodwait('backup_fetch', e.value)
+                await asyncio.sleep(e.value)
+        messages.extend(m for m in fetched if m and not m.empty and m.media)
+    return messages
+
+async def prepare_post(client, owner_id, batch_key, messages):
+    try:
+        return await create_post(client, owner_id, messages)
+    except Exception:
+        logger.exception(f"Could not prepare backup post for '{batch_key}'")
+        return PREPARE_FAILED
+
+async def produce_posts(client, owner_id, source_chat_id, batches, queue):
+    """
+    Runs ahead of the sender: fetches the source messages of several posts with
+    one get_messages call and starts create_post (and with it the poster lookup)
+    for each, then queues (batch_key, task). `batches` is the async iterator
+    from iter_backup_batches; the bounded queue keeps at most BACKUP_PREFETCH
+    posts prepared ahead. Ends with None, or PREFETCH_FAILED if reading the
+    files or their messages failed.
+    """
+
+    async def flush(pending):
+        message_ids = [message_id for _, file_ids in pending for message_id in file_ids]
+        by_id = {m.id: m for m in await fetch_messages(client, source_chat_id, message_ids)}
+        for batch_key, file_ids in pending:
+            messages = [by_id[message_id] for message_id in file_ids if message_id in by_id]
+            task = asyncio.create_task(prepare_post(client, owner_id, batch_key, messages)) if messages else None
+            await queue.put((batch_key, task))
+
+    pending = []
+    pending_ids = 0
+    try:
+        async for batch_key, file_ids in batches:
+            pending.append((batch_key, file_ids))
+            pending_ids += len(file_ids)
+            if pending_ids >= Config.BACKUP_FETCH_CHUNK:
+                await flush(pending)
+                pending, pending_ids = [], 0
+        if pending:
+            await flush(pending)
+    except Exception:
+        # Not the end of the list: the sender must not mark the backup as done
+        logger.exception("Backup prefetch stopped with an error")
+        await queue.put(PREFETCH_FAILED)
+        return
+    await queue.put(None)
+
+async def send_with_retry(client, channel_id, post, bucket):
+    poster, caption, footer = post
+    while True:
+        await bucket.acquire()
+        try:
+            return await send_post(client, channel_id, poster, caption, footer)
+        except FloodWait as e:
+            record_floodwait('backup_post', e.value)
+            bucket.penalize(e.value)
+
+async def run_backup(client, owner_id, channel_id, is_active, on_progress):
+    """
+    Posts every batch of an owner's files to `channel_id`, in batch key order.
+    The checkpoint (last posted batch key and counters) is saved after every
+    post, so a cancelled or crashed backup to the same channel resumes after the
+    last post it made. `is_active()` is polled between posts to support
+    cancellation; `on_progress(text)` receives throttled status updates.
+    Returns the final checkpoint fields.
+    """
+    source_chat_id = client.owner_db_channel_id
+    if not source_chat_id:
+        raise RuntimeError("The owner database channel is not set.")
+
+    checkpoint = await get_backup_checkpoint(owner_id, channel_id)
+    resume_after = None
+    state = {'status': 'running', 'last_key': None, 'posted': 0, 'failed': 0}
+    if checkpoint and checkpoint.get('status') != 'done':
+        resume_after = checkpoint.get('last_key')
+        state.update({key: checkpoint.get(key, state[key]) for key in ('last_key', 'posted', 'failed')})
+
+    await on_progress("⏳ `Step 1/3:` Grouping your files into posts...", force=True)
+    # Files saved before batch keys were stored get theirs now, or they would be skipped
+    await backfill_file_fields(owner_id)
+    remaining = await count_backup_batches(owner_id, resume_after)
+    state['total'] = state['posted'] + state['failed'] + remaining
+    await save_backup_checkpoint(owner_id, channel_id, state)
+    if not remaining:
+        state['status'] = 'done'
+        await save_backup_checkpoint(owner_id, channel_id, state)
+        return state
+
+    resumed = f" Resuming after **{state['posted'] + state['failed']}** already done." if resume_after is not None else ""
+    await on_progress(f"✅ `Step 2/3:` Found **{state['total']}** posts to create.{resumed} Starting...", force=True)
+
+    queue = asyncio.Queue(maxsize=Config.BACKUP_PREFETCH)
+    producer = asyncio.create_task(produce_posts(client, owner_id, source_chat_id, iter_backup_batches(owner_id, resume_after), queue))
+    bucket = TokenBucket(1 / Config.BACKUP_POST_INTERVAL, 1)
+    started_at = time.monotonic()
+    posted_at_start = state['posted']
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if item is PREFETCH_FAILED:
+                raise BackupInterrupted("Reading your files failed partway through.")
+            if not is_active():
+                state['status'] = 'cancelled'
+                break
+            batch_key, task = item
+            post = await task if task else PREPARE_FAILED
+            try:
+                if post is PREPARE_FAILED or not post[1]:
+                    raise RuntimeError("no files left to post" if task is None else "could not build the post")
+                await send_with_retry(client, channel_id, post, bucket)
+                state['posted'] += 1
+            except Exception as e:
+                state['failed'] += 1
+                logger.warning(f"Failed to post batch '{batch_key}' during backup: {e}")
+                await client.send_message(owner_id, f"Failed to post batch for `{batch_key}`. Error: {e}")
+            state['last_key'] = batch_key
+            await save_backup_checkpoint(owner_id, channel_id, state)
+
+            done = state['posted'] + state['failed']
+            rate = (state['posted'] - posted_at_start) / max(time.monotonic() - started_at, 1)
+            await on_progress(f"🔄 `Step 3/3:` Progress: {done} / {state['total']} posts created. (`{rate * 60:.1f}`/min)")
+        if state['status'] == 'running':
+            state['status'] = 'done'
+    except BackupInterrupted:
+        # Left 'running' at the last posted key, so the next start resumes from there
+        raise
+    except BaseException:
+        state['status'] = 'failed'
+        raise
+    finally:
+        producer.cancel()
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item and item[1]:
+                item[1].cancel()
+        await save_backup_checkpoint(owner_id, channel_id, state)
+    return state
@@ -1,22 +1,126 @@
 import asyncio
-from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated
+import datetime
+import logging
+import time
+from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, UserDeactivated, MessageNotModified
+from config import Config
+from database.db import (
+    count_broadcast_users, get_broadcast_user_ids, mark_users_blocked,
+    create_broadcast, get_broadcast, update_broadcast, get_running_broadcasts
+)
+from utils.metrics import record_floodwait
+from utils.rate_limiter import TokenBucket
 
-async def broadcast_message(client, user_ids, message):
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
+logger = logging.getLogger(__name__)
+
+# Broadcasts running in this process, by job id
+ACTIVE_BROADCASTS = {}
+# The BROADCAST_RATE budget, shared by every running broadcast (e.g. a resumed one and a new one)
+broadcast_bucket = TokenBucket(Config.BROADCAST_RATE)
+
+async def start_broadcast(client, target, from_chat_id, message_id, status_message):
+    """Saves a new broadcast job to Mongo and runs it in the background."""
+    job = {
+        'target': target,
+        'from_chat_id': from_chat_id,
+        'message_id': message_id,
+        'status_chat_id': status_message.chat.id,
+        'status_message_id': status_message.id,
+        'status': 'running',
+        'total': await count_broadcast_users(target),
+        'last_user_id': None,
+        'sent': 0, 'failed': 0, 'blocked': 0,
+        'created_at': datetime.datetime.utcnow()
+    }
+    job_id = await create_broadcast(job)
+    ACTIVE_BROADCASTS[job_id] = asyncio.create_task(run_broadcast(client, job_id))
+    return job_id
+
+async def resume_broadcasts(client):
+    """Restarts every broadcast that was still running when the bot stopped."""
+    for job in await get_running_broadcasts():
+        logger.info(f"Resuming broadcast {job['_id']} after user {job.get('last_user_id')}.")
+        ACTIVE_BROADCASTS[job['_id']] = asyncio.create_task(run_broadcast(client, job['_id']))
+
+async def send_to_user(client, job, user_id, bucket):
+    """Copies the broadcast message to one user. Returns 'sent', 'blocked' or 'failed'."""
+    for _ in range(Config.BROADCAST_MAX_RETRIES):
+        await bucket.acquire()
         try:
-            await message.copy(chat_id=user_id)
-            success_count += 1
-            await asyncio.sleep(0.1) # Add a small delay to avoid flood waits
+            await client.copy_message(chat_id=user_id, from_chat_id=job['from_chat_id'], message_id=job['message_id'])
+            return 'sent'
         except FloodWait as e:
-            await asyncio.sleep(e.value)
-            await message.copy(chat_id=user_id)
-            success_count += 1
-        except (UserIsBlocked, InputUserDeactivated):
-            fail_count += 1
+            record_floodwait('broadcast', e.value)
+            bucket.penalize(e.value)
+        except (UserIsBlocked, InputUserDeactivated, UserDeactivated):
+            return 'blocked'
+        # Anything else, including PeerIdInvalid (the peer is unknown to this session,
+        # not gone), fails this delivery without flagging the user for later broadcasts
         except Exception:
-            fail_count += 1
-            
-    return success_count, fail_count
+            return 'failed'
+    return 'failed'
+
+def format_progress(job, started_at, sent_at_start):
+    done = job['sent'] + job['failed'] + job['blocked']
+    elapsed = max(time.monotonic() - started_at, 1)
+    rate = (job['sent'] - sent_at_start) / elapsed
+    remaining = max(job['total'] - done, 0)
+    eta = str(datetime.timedelta(seconds=int(remaining / rate))) if rate > 0 else "unknown"
+    return (
+        "📣 **Broadcasting...**\n\n"
+        f"**Progress:** `{done}` / `{job['total']}`\n"
+        f"**Sent:** `{job['sent']}` | **Blocked:** `{job['blocked']}` | **Failed:** `{job['failed']}`\n"
+        f"**Speed:** `{rate:.1f}` msg/s | **ETA:** `{eta}`"
+    )
+
+async def edit_status(client, job, text):
+    try:
+        await client.edit_message_text(job['status_chat_id'], job['status_message_id'], text)
+    except MessageNotModified:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not update broadcast status message: {e}")
+
+async def run_broadcast(client, job_id):
+    """
+    Sends a broadcast in user_id order, in chunks. Each chunk is sent with
+    bounded concurrency under the global BROADCAST_RATE budget, and the job's
+    checkpoint and counters are saved after every chunk so it can resume.
+    """
+    job = await get_broadcast(job_id)
+    semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+    started_at, sent_at_start = time.monotonic(), job['sent']
+    last_status_at = 0
+
+    async def deliver(user_id):
+        async with semaphore:
+            return user_id, await send_to_user(client, job, user_id, broadcast_bucket)
+
+    try:
+        while True:
+            user_ids = await get_broadcast_user_ids(job['target'], job['last_user_id'], Config.BROADCAST_CHUNK_SIZE)
+            if not user_ids:
+                break
+            results = await asyncio.gather(*(deliver(user_id) for user_id in user_ids))
+            blocked = [user_id for user_id, outcome in results if outcome == 'blocked']
+            for _, outcome in results:
+                job[outcome] += 1
+            await mark_users_blocked(blocked)
+            job['last_user_id'] = user_ids[-1]
+            await update_broadcast(job_id, {key: job[key] for key in ('last_user_id', 'sent', 'failed', 'blocked')})
+
+            if time.monotonic() - last_status_at >= Config.BROADCAST_STATUS_INTERVAL:
+                last_status_at = time.monotonic()
+                await edit_status(client, job, format_progress(job, started_at, sent_at_start))
+
+        await update_broadcast(job_id, {'status': 'done', 'finished_at': datetime.datetime.utcnow()})
+        await edit_status(client, job, (
+            "✅ **Broadcast Complete**\n\n"
+            f"Sent to: `{job['sent']}` users.\nBlocked/Deactivated: `{job['blocked']}` users.\nFailed for: `{job['failed']}` users."
+        ))
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception(f"Broadcast {job_id} stopped with an error. It will resume on the next start.")
+    finally:
+        ACTIVE_BROADCASTS.pop(job_id, None)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import UserNotParticipant
+from config import Config
+from utils.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# (fsub_channel, user_id) pairs recently seen as members. Only positive results are cached.
+member_cache = TTLCache(maxsize=Config.FSUB_MEMBER_CACHE_SIZE, ttl=Config.FSUB_MEMBER_CACHE_TTL)
+# One invite link per FSub channel: channel_id -> (link, checked_at)
+invite_links = {}
+# Invite link exports (and revocation checks) currently running, by channel
+inflight_invite_links = {}
+
+async def is_member(client, fsub_channel, user_id, recheck=False):
+    """
+    Whether the user has joined the FSub channel. A positive answer is cached
+    for FSUB_MEMBER_CACHE_TTL seconds; `recheck` skips the cache, e.g. when the
+    user presses Retry after joining.
+    """
+    key = (fsub_channel, user_id)
+    if recheck:
+        member_cache.pop(key)
+    elif member_cache.get(key) is not MISSING:
+        return True
+    try:
+        await client.get_chat_member(chat_id=fsub_channel, user_id=user_id)
+    except UserNotParticipant:
+        return False
+    member_cache.set(key, True)
+    return True
+
+async def get_invite_link(client, fsub_channel):
+    """
+    The channel's cached invite link, exported once. Every FSUB_INVITE_CHECK_INTERVAL
+    seconds the link is checked in the background and exported again if it was revoked.
+    """
+    cached = invite_links.get(fsub_channel)
+    if cached:
+        link, checked_at = cached
+        if time.monotonic() - checked_at >= Config.FSUB_INVITE_CHECK_INTERVAL and fsub_channel not in inflight_invite_links:
+            start_invite_task(fsub_channel, check_invite_link(client, fsub_channel, link))
+        return link
+    task = inflight_invite_links.get(fsub_channel) or start_invite_task(fsub_channel, export_invite_link(client, fsub_channel))
+    return await asyncio.shield(task)
+
+def start_invite_task(fsub_channel, coro):
+    task = asyncio.create_task(coro)
+    inflight_invite_links[fsub_channel] = task
+    task.add_done_callback(lambda _: inflight_invite_links.pop(fsub_channel, None))
+    return task
+
+async def export_invite_link(client, fsub_channel):
+    """Exports a new invite link. Failures are not cached, so the next request tries again."""
+    try:
+        link = await client.export_chat_invite_link(fsub_channel)
+    except Exception as e:
+        logger.warning(f"Could not export an invite link for FSub channel {fsub_channel}: {e}")
+        return None
+    invite_links[fsub_channel] = (link, time.monotonic())
+    return link
+
+async def check_invite_link(client, fsub_channel, link):
+    try:
+        invite = await client.get_chat_invite_link(fsub_channel, link)
+        revoked = invite.is_revoked
+    except Exception as e:
+        logger.info(f"Invite link for FSub channel {fsub_channel} could not be checked ({e}); exporting a new one.")
+        revoked = True
+    if revoked:
+        return await export_invite_link(client, fsub_channel)
+    invite_links[fsub_channel] = (link, time.monotonic())
+    return link
+
+def forget_fsub_channel(fsub_channel):
+    """Drops a channel's invite link and cached memberships. Called when an owner changes their FSub setting."""
+    invite_links.pop(fsub_channel, None)
+    for key in [key for key in member_cache.data if key[0] == fsub_channel]:
+        member_cache.pop(key)
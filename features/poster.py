@@ -1,69 +1,225 @@
 import aiohttp
-from bs4 import BeautifulSoup
+import asyncio
+import datetime
 import logging
 import re
+from pyrogram.errors import FloodWait
+from config import Config
+from database.db import get_cached_poster, set_cached_poster, set_cached_poster_file_id
+from utils import imdb_html
+from utils.cache import TTLCache, MISSING
+from utils.metrics import EXTERNAL_CALL_SECONDS, EXTERNAL_CALL_ERRORS
 
 logger = logging.getLogger(__name__)
 
-async def get_poster(query: str, year: str = None):
+IMDB_HEADERS = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
+
+# In-process tier in front of the Mongo 'poster_cache' collection
+poster_cache = TTLCache(maxsize=Config.POSTER_CACHE_SIZE, ttl=Config.POSTER_CACHE_TTL)
+# Lookups currently running, so concurrent requests for one title share a single fetch
+inflight_lookups = {}
+# Poster references handed out by get_poster (IMDb URL or Telegram file_id) -> cache key,
+# so send_post can record the file_id of an upload under its title
+poster_refs = TTLCache(maxsize=Config.POSTER_CACHE_SIZE, ttl=Config.POSTER_CACHE_TTL)
+# Poster uploads in progress by cache key, so concurrent sends of a new poster upload it once
+inflight_uploads = {}
+# 'uploads': photos Telegram fetched from a URL; 'reused': sends that reused a file_id instead
+poster_stats = {'uploads': 0, 'reused': 0}
+
+def poster_cache_key(query: str, year: str = None):
+    """Normalizes the (title, year) pair from clean_filename into a cache key."""
+    title = query.strip()
+    if year and title.endswith(year):
+        title = title[:-len(year)]
+    title = re.sub(r'[^a-z0-9]+', ' ', title.lower()).strip()
+    return f"{title}|{year or ''}"
+
+def is_file_id(poster: str):
+    return not poster.startswith(('http://', 'https://'))
+
+def poster_reference(key: str, entry):
+    """What to pass to send_photo for a cache entry: the uploaded file_id when there is one, else the URL."""
+    if not entry:
+        return None
+    reference = entry.get('file_id') or entry['poster_url']
+    poster_refs.set(reference, key)
+    return reference
+
+async def get_poster(session, query: str, year: str = None):
+    """
+    Returns the poster for a title, checking the in-process and Mongo caches
+    before scraping IMDb. Misses are cached too, for a shorter time. Once a
+    poster has been sent, this is its Telegram file_id instead of the URL.
+    """
+    key = poster_cache_key(query, year)
+    entry = poster_cache.get(key)
+    if entry is not MISSING:
+        return poster_reference(key, entry)
+
+    task = inflight_lookups.get(key)
+    if task is None:
+        task = asyncio.create_task(lookup_poster(session, key, query, year))
+        inflight_lookups[key] = task
+        task.add_done_callback(lambda _: inflight_lookups.pop(key, None))
+    return poster_reference(key, await asyncio.shield(task))
+
+async def lookup_poster(session, key: str, query: str, year: str = None):
+    """Resolves a cache miss from Mongo or IMDb and fills both cache tiers. Returns the entry, or None for a miss."""
+    try:
+        cached = await get_cached_poster(key)
+    except Exception as e:
+        logger.warning(f"Could not read poster cache for '{key}': {e}")
+        cached = None
+    if cached:
+        remaining = (cached['expires_at'] - datetime.datetime.utcnow()).total_seconds()
+        entry = {'poster_url': cached['poster_url'], 'file_id': cached.get('file_id')} if cached.get('poster_url') else None
+        poster_cache.set(key, entry, ttl=remaining)
+        return entry
+
+    poster_url, complete = await search_poster(session, query, year)
+    entry = {'poster_url': poster_url, 'file_id': None} if poster_url else None
+    if poster_url or complete:
+        ttl = Config.POSTER_CACHE_TTL if poster_url else Config.POSTER_NEGATIVE_TTL
+        poster_cache.set(key, entry, ttl=ttl)
+        try:
+            await set_cached_poster(key, poster_url, ttl)
+        except Exception as e:
+            logger.warning(f"Could not write poster cache for '{key}': {e}")
+    return entry
+
+def peek_entry(key):
+    """The cached entry for a key without touching hit/miss counters or LRU order; None when absent."""
+    cached = poster_cache.data.get(key)
+    return cached[0] if cached else None
+
+async def set_poster_file_id(key: str, file_id):
+    """Records (or, with None, forgets) the uploaded file_id of a cached poster in both tiers."""
+    entry = peek_entry(key)
+    if entry:
+        entry['file_id'] = file_id
+    if file_id:
+        poster_refs.set(file_id, key)
+    try:
+        await set_cached_poster_file_id(key, file_id)
+    except Exception as e:
+        logger.warning(f"Could not save poster file_id for '{key}': {e}")
+
+async def send_post(client, chat_id, poster, caption, reply_markup=None):
+    """
+    Sends a post, as a photo when there is a poster. The first upload of a
+    poster URL records the returned file_id, and later sends of the same
+    poster, to any chat, reuse it instead of making Telegram fetch the URL again.
+    """
+    if not poster:
+        return await client.send_message(chat_id, caption, reply_markup=reply_markup, disable_web_page_preview=True)
+    key = poster_refs.get(poster)
+    entry = peek_entry(key) or {}
+    # Upgrade a URL handed out before the first upload finished
+    photo = entry.get('file_id') or poster
+    if is_file_id(photo):
+        try:
+            message = await client.send_photo(chat_id, photo=photo, caption=caption, reply_markup=reply_markup)
+            poster_stats['reused'] += 1
+            return message
+        except FloodWait:
+            raise
+        except Exception as e:
+            url = entry.get('poster_url')
+            if not url:
+                raise
+            logger.warning(f"Cached poster file_id for '{key}' failed ({e}); sending the URL again.")
+            await set_poster_file_id(key, None)
+            photo = url
+    if key is not MISSING:
+        upload = inflight_uploads.get(key)
+        if upload is not None:
+            # Another channel is uploading this poster right now; reuse its file_id when it lands
+            await asyncio.wait([upload])
+            file_id = (peek_entry(key) or {}).get('file_id')
+            if file_id:
+                return await send_post(client, chat_id, file_id, caption, reply_markup)
+        inflight_uploads[key] = upload = asyncio.get_running_loop().create_future()
+    try:
+        message = await client.send_photo(chat_id, photo=photo, caption=caption, reply_markup=reply_markup)
+        poster_stats['uploads'] += 1
+        if key is not MISSING and message.photo:
+            await set_poster_file_id(key, message.photo.file_id)
+        return message
+    finally:
+        if key is not MISSING:
+            upload.set_result(None)
+            if inflight_uploads.get(key) is upload:
+                del inflight_uploads[key]
+
+async def search_poster(session, query: str, year: str = None):
     """
     Finds a poster by scraping IMDb with an improved multi-pass search.
+    Returns (poster_url, complete); `complete` is False when a pass failed
+    with an error, so the miss is not worth caching.
     """
+    complete = True
     try:
         # --- Pass 1: Highly specific search with title and year ---
         search_query_with_year = f"{query} {year}".strip() if year else query
-        poster_url = await fetch_imdb_poster(search_query_with_year)
+        try:
+            poster_url = await fetch_imdb_poster(session, search_query_with_year)
+        except Exception:
+            # Don't log full exception for fetch, as it's part of a fallback strategy
+            logger.warning(f"A sub-search for poster '{search_query_with_year}' failed.")
+            poster_url, complete = None, False
         
         if poster_url:
-            return poster_url
+            return poster_url, True
 
         # --- Pass 2: Broader search without the year (if first pass failed) ---
         if year is not None:
             logger.warning(f"Poster search failed for '{search_query_with_year}'. Retrying without the year.")
-            poster_url = await fetch_imdb_poster(query)
+            try:
+                poster_url = await fetch_imdb_poster(session, query)
+            except Exception:
+                logger.warning(f"A sub-search for poster '{query}' failed.")
+                poster_url, complete = None, False
             if poster_url:
-                return poster_url
+                return poster_url, True
         
         logger.warning(f"All poster search passes failed for query '{query}'.")
-        return None
+        return None, complete
 
     except Exception as e:
         logger.error(f"An unexpected error occurred during poster scraping for query '{query}': {e}")
-        return None
+        return None, False
 
-async def fetch_imdb_poster(search_query):
-    """The core function to fetch a poster from IMDb for a given query."""
-    try:
-        search_query_encoded = re.sub(r'\s+', '+', search_query)
-        search_url = f"https://www.imdb.com/find?q={search_query_encoded}"
-        headers = {'User-Agent': 'Mozilla/5.0', 'Accept-Language': 'en-US,en;q=0.5'}
+async def fetch_imdb_poster(session, search_query):
+    """The core function to fetch a poster from IMDb for a given query. Network errors propagate to the caller."""
+    with EXTERNAL_CALL_SECONDS.time(service='imdb'):
+        try:
+            return await scrape_imdb_poster(session, search_query)
+        except Exception:
+            EXTERNAL_CALL_ERRORS.inc(service='imdb')
+            raise
+
+async def scrape_imdb_poster(session, search_query):
+    search_query_encoded = re.sub(r'\s+', '+', search_query)
+    search_url = f"https://www.imdb.com/find?q={search_query_encoded}"
+    
+    async with session.get(search_url, headers=IMDB_HEADERS) as resp:
+        if resp.status != 200: return None
+        result_href = await imdb_html.extract(imdb_html.extract_result_href, await resp.text())
+        if not result_href: return None
+        movie_url = "https://www.imdb.com" + result_href.split('?')[0]
+
+    async with session.get(movie_url, headers=IMDB_HEADERS) as movie_resp:
+        if movie_resp.status != 200: return None
+        # Only the main poster, not the other images on the title page
+        poster_url = await imdb_html.extract(imdb_html.extract_poster_src, await movie_resp.text())
         
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(search_url) as resp:
-                if resp.status != 200: return None
-                soup = BeautifulSoup(await resp.text(), 'html.parser')
-                result_link_tag = soup.select_one("a.ipc-metadata-list-summary-item__t")
-                if not result_link_tag or not result_link_tag.get('href'): return None
-                movie_url = "https://www.imdb.com" + result_link_tag['href'].split('?')[0]
-
-            async with session.get(movie_url) as movie_resp:
-                if movie_resp.status != 200: return None
-                movie_soup = BeautifulSoup(await movie_resp.text(), 'html.parser')
-                
-                # Use a very specific selector to target only the main poster
-                img_tag = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
-                
-                if img_tag and img_tag.get('src'):
-                    poster_url = img_tag['src']
-                    if '_V1_' in poster_url:
-                        poster_url = poster_url.split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
-                    
-                    # Final verification that the URL is a real image
-                    async with session.head(poster_url, timeout=5) as head_resp:
-                        if head_resp.status == 200 and 'image' in head_resp.headers.get('Content-Type', ''):
-                            logger.info(f"Successfully found and verified poster for '{search_query}'")
-                            return poster_url
-    except Exception:
-        # Don't log full exception for fetch, as it's part of a fallback strategy
-        logger.warning(f"A sub-search for poster '{search_query}' failed.")
+        if poster_url:
+            if '_V1_' in poster_url:
+                poster_url = poster_url.split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
+            
+            # Final verification that the URL is a real image
+            async with session.head(poster_url, headers=IMDB_HEADERS, timeout=aiohttp.ClientTimeout(total=5)) as head_resp:
+                if head_resp.status == 200 and 'image' in head_resp.headers.get('Content-Type', ''):
+                    logger.info(f"Successfully found and verified poster for '{search_query}'")
+                    return poster_url
     return None
@@ -0,0 +1,119 @@
+"""
+The /get/{file_unique_id} web redirector. It runs inside the bot, and can
+also run as extra worker processes sharing the same port via SO_REUSEPORT:
+
+    python -m features.redirector --workers 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from aiohttp import web
+from config import Config
+from database.db import load_known_file_ids, is_known_file_id
+
+logger = logging.getLogger(__name__)
+
+
+class Redirector:
+    """Holds the bot username in memory and answers /get requests without touching disk or Mongo."""
+
+    def __init__(self, username_file: str = Config.BOT_USERNAME_FILE):
+        self.username_file = username_file
+        self.username_mtime = None
+        self.bot_username = None
+        self.refresh_task = None
+        self.last_refresh = 0.0
+
+    def set_username(self, username: str):
+        self.bot_username = username.strip().replace("@", "")
+
+    def reload_username(self):
+        """Re-reads the username file only if it changed since the last read."""
+        try:
+            mtime = os.stat(self.username_file).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self.username_mtime:
+            with open(self.username_file, 'r') as f:
+                self.set_username(f.read())
+            self.username_mtime = mtime
+
+    async def refresh_known_ids(self):
+        """
+        Loads file IDs saved since the last refresh. Concurrent callers share one
+        query, and misses can trigger at most one refresh per second, so scraper
+        traffic cannot turn into database load.
+        """
+        if self.refresh_task is None:
+            if time.monotonic() - self.last_refresh < 1:
+                return
+            self.last_refresh = time.monotonic()
+            self.refresh_task = asyncio.create_task(load_known_file_ids())
+            self.refresh_task.add_done_callback(lambda _: setattr(self, 'refresh_task', None))
+        await asyncio.shield(self.refresh_task)
+
+    async def refresh_loop(self, interval: int = Config.REDIRECTOR_REFRESH_INTERVAL):
+        """Keeps the username and the known-ID set current."""
+        while True:
+            try:
+                self.reload_username()
+                await self.refresh_known_ids()
+            except Exception as e:
+                logger.warning(f"Redirector refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def handle_redirect(self, request):
+        file_unique_id = request.match_info.get('file_unique_id', None)
+        if not file_unique_id:
+            return web.Response(text="File ID missing.", status=400)
+        if not is_known_file_id(file_unique_id):
+            # The file may have been saved by another process since the last refresh
+            try:
+                await self.refresh_known_ids()
+            except Exception as e:
+                logger.warning(f"Redirector refresh failed: {e}")
+            if not is_known_file_id(file_unique_id):
+                return web.Response(text="File not found.", status=404)
+        if not self.bot_username:
+            logger.error(f"FATAL: Bot username not known. Check {self.username_file}")
+            return web.Response(text="Bot configuration error.", status=500)
+        payload = f"get_{file_unique_id}"
+        telegram_url = f"https://t.me/{self.bot_username}?start={payload}"
+        return web.HTTPFound(telegram_url)
+
+
+def create_app(redirector: Redirector):
+    app = web.Application()
+    app['redirector'] = redirector
+    app.router.add_get('/get/{file_unique_id}', redirector.handle_redirect)
+    return app
+
+
+async def serve(host: str, port: int):
+    """Runs one standalone redirector process until it is killed."""
+    redirector = Redirector()
+    redirector.reload_username()
+    runner = web.AppRunner(create_app(redirector), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, reuse_port=True).start()
+    logger.info(f"Redirector worker {os.getpid()} serving http://{host}:{port}")
+    await redirector.refresh_loop()
+
+
+def run_worker(host: str, port: int):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(serve(host, port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default=Config.VPS_IP)
+    parser.add_argument("--port", type=int, default=Config.VPS_PORT)
+    args = parser.parse_args()
+    processes = [multiprocessing.Process(target=run_worker, args=(args.host, args.port)) for _ in range(args.workers)]
+    for process in processes: process.start()
+    for process in processes: process.join()
@@ -1,32 +1,91 @@
-import aiohttp
+import asyncio
 import logging
-from database.db import get_user
+from config import Config
+from database.db import get_user, get_cached_shortlink, set_cached_shortlink, delete_cached_shortlinks
+from utils.cache import TTLCache, MISSING
+from utils.metrics import EXTERNAL_CALL_SECONDS, EXTERNAL_CALL_ERRORS
 
 logger = logging.getLogger(__name__)
 
-async def get_shortlink(link_to_shorten, user_id):
-    """Shortens the provided link using the user's settings."""
-    user = await get_user(user_id)
+# In-process tier in front of the Mongo 'shortlinks' collection, keyed by (owner_id, shortener_url, long_url)
+shortlink_cache = TTLCache(maxsize=Config.SHORTLINK_CACHE_SIZE, ttl=Config.SHORTLINK_CACHE_TTL)
+# Shortenings currently running, so a burst of visitors to a new link makes one API call
+inflight_shortlinks = {}
+
+async def get_shortlink(session, link_to_shorten, user_id, user=None):
+    """
+    Shortens the provided link using the user's settings.
+    Pass the owner's settings as `user` when the caller already has them.
+    """
+    if user is None:
+        user = await get_user(user_id)
     if not user or not user.get('shortener_enabled') or not user.get('shortener_url'):
         # If shortener is disabled or not set, return the original link
         return link_to_shorten
 
     URL = user['shortener_url'].strip()
     API = user['shortener_api'].strip()
+    key = (user_id, URL, link_to_shorten)
+
+    short_url = shortlink_cache.get(key)
+    if short_url is not MISSING:
+        return short_url
+
+    task = inflight_shortlinks.get(key)
+    if task is None:
+        task = asyncio.create_task(lookup_shortlink(session, key, API))
+        inflight_shortlinks[key] = task
+        task.add_done_callback(lambda _: inflight_shortlinks.pop(key, None))
+    return await asyncio.shield(task)
 
+async def lookup_shortlink(session, key, api_key):
+    """Resolves a cache miss from Mongo or the shortener API. Only successful shortenings are cached."""
+    user_id, URL, link_to_shorten = key
+    try:
+        short_url = await get_cached_shortlink(user_id, URL, link_to_shorten)
+    except Exception as e:
+        logger.warning(f"Could not read shortlink cache for user {user_id}: {e}")
+        short_url = None
+    if short_url:
+        shortlink_cache.set(key, short_url)
+        return short_url
+
+    short_url = await request_shortlink(session, URL, api_key, link_to_shorten, user_id)
+    if short_url != link_to_shorten:
+        shortlink_cache.set(key, short_url)
+        try:
+            await set_cached_shortlink(user_id, URL, link_to_shorten, short_url)
+        except Exception as e:
+            logger.warning(f"Could not write shortlink cache for user {user_id}: {e}")
+    return short_url
+
+async def request_shortlink(session, URL, API, link_to_shorten, user_id):
+    """Calls the shortener API. Returns the original link on any failure."""
+    with EXTERNAL_CALL_SECONDS.time(service='shortener'):
+        short_url = await call_shortener(session, URL, API, link_to_shorten, user_id)
+    if short_url == link_to_shorten:
+        EXTERNAL_CALL_ERRORS.inc(service='shortener')
+    return short_url
+
+async def call_shortener(session, URL, API, link_to_shorten, user_id):
     try:
         url = f'https://{URL}/api'
         params = {'api': API, 'url': link_to_shorten}
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, raise_for_status=True, ssl=False) as response:
-                data = await response.json(content_type=None)
-                if data.get("status") == "success" and data.get("shortenedUrl"):
-                    return data["shortenedUrl"]
-                else:
-                    logger.error(f"Shortener error for user {user_id}: {data.get('message', 'Unknown error')}")
-                    # On failure, return the original un-shortened link
-                    return link_to_shorten
+        async with session.get(url, params=params, raise_for_status=True, ssl=False) as response:
+            data = await response.json(content_type=None)
+            if data.get("status") == "success" and data.get("shortenedUrl"):
+                return data["shortenedUrl"]
+            else:
+                logger.error(f"Shortener error for user {user_id}: {data.get('message', 'Unknown error')}")
+                # On failure, return the original un-shortened link
+                return link_to_shorten
     except Exception as e:
         logger.error(f"HTTP Error during shortening for user {user_id}: {e}")
         return link_to_shorten
+
+async def invalidate_shortlinks(user_id):
+    """Forgets an owner's cached shortlinks in both tiers. Called when they change their shortener."""
+    for key in [key for key in shortlink_cache.data if key[0] == user_id]:
+        shortlink_cache.pop(key)
+    await delete_cached_shortlinks(user_id)
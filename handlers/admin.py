@@ -4,10 +4,12 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database.db import (
-    total_users_count, get_all_user_ids, get_storage_owners_count, 
-    get_normal_user_ids, delete_all_files, set_owner_db_channel
+    total_users_count, get_storage_owners_count, 
+    delete_all_files, set_owner_db_channel, get_user_cache_stats
 )
-from features.broadcaster import broadcast_message
+from features.broadcaster import start_broadcast
+from features.poster import poster_stats
+from utils.tracing import exporter as trace_exporter, summarize
 from utils.helpers import go_back_button
 
 logger = logging.getLogger(__name__)
@@ -47,7 +49,7 @@ async def set_owner_db_handler(client, query):
 # --- Existing Admin Commands ---
 
 @Client.on_message(filters.command("stats") & filters.user(Config.ADMIN_ID))
-async def stats_handler(_, message):
+async def stats_handler(client, message):
     try:
         total = await total_users_count()
         storage_owners = await get_storage_owners_count()
@@ -57,11 +59,49 @@ async def stats_handler(_, message):
             f"**Storage Owners:** `{storage_owners}`\n"
             f"_(Storage Owners are users who have set at least one channel)_"
         )
+        cache = get_user_cache_stats()
+        lookups = cache['hits'] + cache['misses']
+        if lookups:
+            text += (
+                "\n\n⚡ **User Settings Cache**\n"
+                f"**Hits:** `{cache['hits']}` / `{lookups}` ({cache['hits'] / lookups:.0%}), `{cache['size']}` cached"
+            )
+        flush_reasons, sizes = client.batch_stats['flush_reasons'], client.batch_stats['sizes']
+        posted = sum(sizes.values())
+        if posted:
+            files = sum(size * count for size, count in sizes.items())
+            text += (
+                "\n\n📦 **Batching (since restart)**\n"
+                f"**Posts:** `{posted}` for `{files}` files (avg `{files / posted:.1f}`, max `{max(sizes)}`)\n"
+                f"**Flushed by:** idle `{flush_reasons['idle']}`, max wait `{flush_reasons['max_wait']}`, max size `{flush_reasons['max_size']}`"
+            )
+        uploads, reused = poster_stats['uploads'], poster_stats['reused']
+        if uploads or reused:
+            text += (
+                "\n\n🖼️ **Posters (since restart)**\n"
+                f"**Uploaded from URL:** `{uploads}` | **Reused file_id:** `{reused}` (remote fetches saved)"
+            )
         await message.reply_text(text)
     except Exception:
         logger.exception("Error in /stats handler")
         await message.reply_text("An error occurred while fetching stats.")
 
+@Client.on_message(filters.command("traces") & filters.user(Config.ADMIN_ID))
+async def traces_handler(client, message):
+    """/traces [count]: the slowest recently published files, with where their time went."""
+    try:
+        count = int(message.command[1]) if len(message.command) > 1 else 5
+    except ValueError:
+        return await message.reply_text("Usage: `/traces [count]`")
+    traces = trace_exporter.slowest(min(max(count, 1), 20), name='file')
+    if not traces:
+        return await message.reply_text("No file traces recorded since the last restart.")
+    lines = [f"🐢 **Slowest {len(traces)} of the last {len(trace_exporter.recent)} traces**\n"]
+    for trace in traces:
+        lines.append(f"`{trace.trace_id}` **{trace.attrs.get('file') or 'unknown'}** (user `{trace.attrs.get('owner')}`)")
+        lines.append(f"`{summarize(trace)}`" + (f"\n⚠️ `{trace.attrs['error']}`" if trace.attrs.get('error') else "") + "\n")
+    await message.reply_text("\n".join(lines))
+
 @Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN_ID))
 async def broadcast_prompt_handler(client, message):
     if not message.reply_to_message:
@@ -82,22 +122,14 @@ async def broadcast_callback_handler(client, query):
         broadcast_type, message_id_str = query.data.split("_")[1:]
         message_id = int(message_id_str)
 
-        await query.message.edit_text("Fetching user list... Please wait.")
-        
         message_to_broadcast = await client.get_messages(chat_id=query.message.chat.id, message_ids=message_id)
-        if not message_to_broadcast:
+        if not message_to_broadcast or message_to_broadcast.empty:
             return await query.message.edit_text("Error: Could not find the original message to broadcast.")
 
-        if broadcast_type == "all":
-            user_ids = await get_all_user_ids()
-        elif broadcast_type == "storage":
-            user_ids = await get_storage_owner_ids()
-        else: # broadcast_type == "normal"
-            user_ids = await get_normal_user_ids()
-            
-        status_msg = await query.message.edit_text(f"Broadcasting to {len(user_ids)} users...")
-        success, fail = await broadcast_message(client, user_ids, message_to_broadcast)
-        await status_msg.edit_text(f"✅ **Broadcast Complete**\n\nSent to: `{success}` users.\nFailed for: `{fail}` users.")
+        # The job runs in the background and is saved to Mongo, so it resumes after a restart.
+        # broadcast_type is one of "all", "storage" or "normal".
+        status_msg = await query.message.edit_text("📣 Starting broadcast... Progress will be shown here.")
+        await start_broadcast(client, broadcast_type, query.message.chat.id, message_id, status_msg)
     except Exception:
         logger.exception("Error in broadcast_callback_handler")
         await query.message.edit_text("An error occurred during broadcast.")
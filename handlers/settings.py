@@ -1,18 +1,27 @@
 import asyncio
-import base64
 import logging
+import secrets
+import time
+from bson import ObjectId
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import MessageNotModified
+from config import Config
 from database.db import (
     get_user, update_user, add_to_list, remove_from_list, 
     get_user_file_count, add_footer_button, remove_footer_button, 
-    get_all_user_files, get_paginated_files, search_user_files
+    get_paginated_files, search_user_files
 )
-from utils.helpers import go_back_button, get_main_menu, create_post, encode_link, get_batch_key
+from features.backup import run_backup
+from features.shortener import invalidate_shortlinks
+from features.fsub import forget_fsub_channel
+from utils.helpers import go_back_button, get_main_menu, encode_link, get_batch_settings
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 ACTIVE_BACKUP_TASKS = set()
+# Search queries by session id, so the pagination callback data stays small
+SEARCH_SESSIONS = TTLCache(maxsize=5000, ttl=3600)
 
 async def safe_edit_message(query, *args, **kwargs):
     """A helper function to safely edit messages and handle common errors."""
@@ -85,7 +94,25 @@ async def get_fsub_menu_parts(client, user_id):
     ]
     return text, InlineKeyboardMarkup(buttons)
 
-@Client.on_callback_query(filters.regex(r"^(shortener|caption|poster|fsub)_menu$"))
+async def get_batch_menu_parts(user_id):
+    user = await get_user(user_id)
+    idle, max_wait, max_size = get_batch_settings(user)
+    text = (
+        "**⏱️ Batch Window**\n\n"
+        "Files with the same name are collected into one post.\n"
+        f"**Idle Window:** `{idle}s` _(each new file waits this long for the next one)_\n"
+        f"**Max Wait:** `{max_wait}s` _(a batch is never held longer than this)_\n"
+        f"**Max Size:** `{max_size}` _(a batch this big is posted immediately)_"
+    )
+    buttons = [
+        [InlineKeyboardButton("⚙️ Set Idle Window", callback_data="set_batch_idle")],
+        [InlineKeyboardButton("⚙️ Set Max Wait", callback_data="set_batch_wait")],
+        [InlineKeyboardButton("⚙️ Set Max Size", callback_data="set_batch_size")],
+        [InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")]
+    ]
+    return text, InlineKeyboardMarkup(buttons)
+
+@Client.on_callback_query(filters.regex(r"^(shortener|caption|poster|fsub|batch)_menu$"))
 async def settings_submenu_handler(client, query):
     user_id = query.from_user.id
     menu_type = query.data.split("_")[0]
@@ -98,6 +125,8 @@ async def settings_submenu_handler(client, query):
         text, markup = await get_poster_menu_parts(user_id)
     elif menu_type == "fsub":
         text, markup = await get_fsub_menu_parts(client, user_id)
+    elif menu_type == "batch":
+        text, markup = await get_batch_menu_parts(user_id)
     else:
         return
         
@@ -123,34 +152,47 @@ async def toggle_handler(client, query):
 
 # --- "MY FILES" & PERSONAL SEARCH ---
 
-@Client.on_callback_query(filters.regex(r"my_files_(\d+)"))
+def _file_list_text(bot_username, files_list):
+    text = ""
+    for file in files_list:
+        payload = f"get_{file['file_unique_id']}"
+        deep_link = f"https://t.me/{bot_username}?start={payload}"
+        text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+    return text
+
+# Callback data stays under Telegram's 64-byte limit: page number, direction (n/p) and the edge file's _id in hex
+@Client.on_callback_query(filters.regex(r"^my_files_(\d+)(?:_([np])([0-9a-f]{24}))?$"))
 async def my_files_handler(client, query):
     try:
         user_id = query.from_user.id
-        page = int(query.data.split("_")[-1])
+        page = int(query.matches[0].group(1))
+        direction = 'prev' if query.matches[0].group(2) == 'p' else 'next'
+        cursor = ObjectId(query.matches[0].group(3)) if query.matches[0].group(3) else None
         total_files = await get_user_file_count(user_id)
         files_per_page = 5
         bot_username = client.me.username
         
         text = f"**📂 Your Saved Files ({total_files} Total)**\n\n"
+        files_on_page, more = [], False
         
         if total_files > 0:
-            files_on_page = await get_paginated_files(user_id, page, files_per_page)
+            files_on_page, more = await get_paginated_files(user_id, cursor, direction, files_per_page)
             if files_on_page:
-                for file in files_on_page:
-                    payload = f"get_{file['file_unique_id']}"
-                    deep_link = f"https://t.me/{bot_username}?start={payload}"
-                    text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+                text += _file_list_text(bot_username, files_on_page)
             else:
                 text += "No more files found on this page."
         else:
             text += "You have not saved any files yet."
+        if direction == 'prev' and not more:
+            page = 1
             
+        has_prev = page > 1
+        has_next = more if direction == 'next' else True
         buttons, nav_row = [], []
-        if page > 1:
-            nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"my_files_{page-1}"))
-        if total_files > page * files_per_page:
-            nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"my_files_{page+1}"))
+        if files_on_page and has_prev:
+            nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"my_files_{page-1}_p{files_on_page[0]['_id']}"))
+        if files_on_page and has_next:
+            nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"my_files_{page+1}_n{files_on_page[-1]['_id']}"))
         if nav_row: buttons.append(nav_row)
         buttons.append([InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")])
         buttons.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")])
@@ -160,28 +202,41 @@ async def my_files_handler(client, query):
         logger.exception("Error in my_files_handler")
         await query.answer("Something went wrong.", show_alert=True)
 
-async def _format_and_send_search_results(client, query, user_id, search_query, page):
+def _search_cursor(file):
+    return f"{int(file['exact'])}{file['token_count']}.{file['_id']}"
+
+async def _format_and_send_search_results(client, query, user_id, session_id, page=1, direction='next', cursor=None):
+    session = SEARCH_SESSIONS.get(session_id, None)
+    if not session:
+        return await safe_edit_message(query, text="This search has expired. Please search again.", reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")],
+            [InlineKeyboardButton("« Go Back to Settings", callback_data=f"go_back_{user_id}")]
+        ]))
+    search_query = session['query']
     files_per_page = 5
-    files_list, total_files = await search_user_files(user_id, search_query, page, files_per_page)
+    files_list, total_files, more = await search_user_files(
+        user_id, search_query, cursor, direction, files_per_page, with_total=session['total'] is None)
+    if session['total'] is None: session['total'] = total_files
+    total_files = session['total']
     bot_username = client.me.username
-    text = f"**🔎 Search Results for `{search_query}` ({total_files} Found)**\n\n"
+    total_label = f"{total_files}+" if total_files >= Config.SEARCH_CANDIDATES else total_files
+    text = f"**🔎 Search Results for `{search_query}` ({total_label} Found)**\n\n"
 
     if not files_list:
         text += "No files found for your query."
     else:
-        for file in files_list:
-            payload = f"get_{file['file_unique_id']}"
-            deep_link = f"https://t.me/{bot_username}?start={payload}"
-            text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
+        text += _file_list_text(bot_username, files_list)
+    if direction == 'prev' and not more:
+        page = 1
 
     buttons = []
     nav_row = []
-    encoded_query = base64.urlsafe_b64encode(search_query.encode()).decode().strip("=")
-
-    if page > 1:
-        nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_{encoded_query}"))
-    if total_files > page * files_per_page:
-        nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_{encoded_query}"))
+    has_prev = page > 1
+    has_next = more if direction == 'next' else True
+    if files_list and has_prev:
+        nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_p{_search_cursor(files_list[0])}_{session_id}"))
+    if files_list and has_next:
+        nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_n{_search_cursor(files_list[-1])}_{session_id}"))
     if nav_row: buttons.append(nav_row)
     buttons.append([InlineKeyboardButton("📚 Back to Full List", callback_data="my_files_1")])
     buttons.append([InlineKeyboardButton("« Go Back to Settings", callback_data=f"go_back_{user_id}")])
@@ -199,7 +254,10 @@ async def search_my_files_prompt(client, query):
         search_query = response.text
         
         await response.delete()
-        await _format_and_send_search_results(client, query, user_id, search_query, 1)
+        # The query text is kept server-side so the page buttons only carry a short session id
+        session_id = secrets.token_hex(4)
+        SEARCH_SESSIONS.set(session_id, {'query': search_query, 'total': None})
+        await _format_and_send_search_results(client, query, user_id, session_id)
 
     except asyncio.TimeoutError:
         await safe_edit_message(query, text="❗️ **Timeout:** Search cancelled.", reply_markup=go_back_button(user_id))
@@ -207,15 +265,14 @@ async def search_my_files_prompt(client, query):
         logger.exception("Error in search_my_files_prompt")
         await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
 
-@Client.on_callback_query(filters.regex(r"search_results_(\d+)_(.+)"))
+@Client.on_callback_query(filters.regex(r"^search_results_(\d+)_([np])([01])(\d+)\.([0-9a-f]{24})_([0-9a-f]{8})$"))
 async def search_results_paginator(client, query):
     try:
         user_id = query.from_user.id
-        page = int(query.matches[0].group(1))
-        encoded_query = query.matches[0].group(2)
-        padding = 4 - (len(encoded_query) % 4)
-        search_query = base64.urlsafe_b64decode(encoded_query + "=" * padding).decode()
-        await _format_and_send_search_results(client, query, user_id, search_query, page)
+        page_str, direction, exact, token_count, file_id, session_id = query.matches[0].groups()
+        cursor = (exact == "1", int(token_count), ObjectId(file_id))
+        await _format_and_send_search_results(
+            client, query, user_id, session_id, int(page_str), 'prev' if direction == 'p' else 'next', cursor)
     except Exception as e:
         logger.exception("Error during search pagination")
         await safe_edit_message(query, text="An error occurred during pagination.")
@@ -248,48 +305,28 @@ async def start_backup_process(client, query):
         return await query.answer("A backup process is already running.", show_alert=True)
     channel_id = int(query.data.split("_")[-1])
     ACTIVE_BACKUP_TASKS.add(user_id)
+    cancel_markup = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]])
+    last_edit = {'at': 0.0}
+
+    async def on_progress(text, force=False):
+        # Editing the status on every post would run into Telegram's edit limits
+        now = time.monotonic()
+        if force or now - last_edit['at'] >= Config.BACKUP_STATUS_INTERVAL:
+            last_edit['at'] = now
+            await safe_edit_message(query, text=text, reply_markup=cancel_markup)
+
     try:
-        progress_msg = await query.message.edit_text("⏳ `Step 1/3:` Fetching all your file records...")
-        all_files_cursor = await get_all_user_files(user_id)
-        batches = {}
-        async for file_doc in all_files_cursor:
-            if not file_doc or not file_doc.get('file_name'): continue
-            batch_key = get_batch_key(file_doc['file_name'])
-            if batch_key not in batches: batches[batch_key] = []
-            batches[batch_key].append(file_doc)
-        total_batches = len(batches)
-        if total_batches == 0:
+        state = await run_backup(client, user_id, channel_id, lambda: user_id in ACTIVE_BACKUP_TASKS, on_progress)
+        if state['status'] == 'cancelled':
+            return await safe_edit_message(query, text="❌ Backup process has been cancelled. Start it again to resume where it stopped.", reply_markup=go_back_button(user_id))
+        if state['total'] == 0:
             return await safe_edit_message(query, text="You have no files to back up.", reply_markup=go_back_button(user_id))
-        
-        await safe_edit_message(query, text=f"✅ `Step 2/3:` Found **{total_batches}** posts to create. Starting...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-        
-        for i, (batch_key, file_docs) in enumerate(batches.items()):
-            if user_id not in ACTIVE_BACKUP_TASKS:
-                await safe_edit_message(query, text="❌ Backup process has been cancelled.", reply_markup=go_back_button(user_id))
-                return
-            try:
-                message_ids = [doc['file_id'] for doc in file_docs]
-                # All files are now in the single owner DB, so we can get chat_id from config
-                from config import Config
-                source_chat_id = Config.OWNER_DATABASE_CHANNEL
-                file_messages = await client.get_messages(source_chat_id, message_ids)
-                poster, caption, footer = await create_post(client, user_id, file_messages)
-                if poster: await client.send_photo(channel_id, photo=poster, caption=caption, reply_markup=footer)
-                else: await client.send_message(channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                
-                progress_text = f"🔄 `Step 3/3:` Progress: {i + 1} / {total_batches} posts created."
-                await safe_edit_message(query, text=progress_text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-                await asyncio.sleep(3)
-            except Exception as e:
-                logger.exception(f"Failed to post batch '{batch_key}' during backup.")
-                await client.send_message(user_id, f"Failed to post batch for `{batch_key}`. Error: {e}")
-        
         await query.message.delete()
-        await client.send_message(user_id, "✅ **Backup Complete!** All posts have been created.", reply_markup=go_back_button(user_id))
+        await client.send_message(user_id, f"✅ **Backup Complete!** {state['posted']} posts have been created." + (f" {state['failed']} failed." if state['failed'] else ""), reply_markup=go_back_button(user_id))
 
     except Exception as e:
         logger.exception("Major error in backup process")
-        await safe_edit_message(query, text=f"A major error occurred: {e}", reply_markup=go_back_button(user_id))
+        await safe_edit_message(query, text=f"A major error occurred: {e}\n\nStart the backup again to resume where it stopped.", reply_markup=go_back_button(user_id))
     finally:
         ACTIVE_BACKUP_TASKS.discard(user_id)
 
@@ -428,6 +465,11 @@ async def set_value_handler(client, query):
         else: # download or filename_link
             if not response.text.startswith(("http://", "https://")): return await response.reply("Invalid URL.", reply_markup=go_back_button(user_id))
             value = response.text
+        if action == "fsub":
+            # A fresh invite link for the new channel; the old channel's cached state goes too
+            old_channel = (await get_user(user_id) or {}).get('fsub_channel')
+            for channel_id in {old_channel, value} - {None}:
+                forget_fsub_channel(channel_id)
         await update_user(user_id, key, value)
         await response.reply("✅ Settings updated!", reply_markup=go_back_button(user_id))
         await question.delete()
@@ -450,6 +492,7 @@ async def set_shortener_handler(client, query):
         api_msg = await client.listen(chat_id=user_id, timeout=300, filters=filters.text)
         await update_user(user_id, "shortener_url", domain_msg.text.strip())
         await update_user(user_id, "shortener_api", api_msg.text.strip())
+        await invalidate_shortlinks(user_id)
         await domain_msg.delete()
         await api_msg.delete()
         text, markup = await get_shortener_menu_parts(user_id)
@@ -459,3 +502,29 @@ async def set_shortener_handler(client, query):
     except Exception as e:
         logger.exception("Error in set_shortener_handler")
         await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
+
+@Client.on_callback_query(filters.regex(r"^set_batch_(idle|wait|size)$"))
+async def set_batch_handler(client, query):
+    user_id = query.from_user.id
+    setting = query.data.split("_")[-1]
+    prompts = {
+        "idle": ("Send the idle window in seconds (1-300).", "batch_idle_window", 1, 300),
+        "wait": ("Send the max wait in seconds (5-3600).", "batch_max_wait", 5, 3600),
+        "size": ("Send the max number of files per post (1-100).", "batch_max_size", 1, 100)
+    }
+    prompt_text, key, low, high = prompts[setting]
+    try:
+        await query.message.edit_text(f"**⏱️ Batch Window**\n\n{prompt_text}", reply_markup=go_back_button(user_id))
+        response = await client.listen(chat_id=user_id, timeout=300, filters=filters.text)
+        value = response.text.strip()
+        await response.delete()
+        if not value.isdigit() or not low <= int(value) <= high:
+            return await safe_edit_message(query, text=f"Invalid value. Please send a number between {low} and {high}.", reply_markup=go_back_button(user_id))
+        await update_user(user_id, key, int(value))
+        text, markup = await get_batch_menu_parts(user_id)
+        await safe_edit_message(query, text=text, reply_markup=markup)
+    except asyncio.TimeoutError:
+        await safe_edit_message(query, text="❗️ **Timeout:** Command cancelled.", reply_markup=go_back_button(user_id))
+    except Exception as e:
+        logger.exception("Error in set_batch_handler")
+        await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
@@ -1,13 +1,14 @@
 import traceback
 import logging
 from pyrogram import Client, filters, enums
-from pyrogram.errors import UserNotParticipant, MessageNotModified
+from pyrogram.errors import MessageNotModified
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from config import Config
 # --- FIX: Import the function to get the owner DB ID ---
 from database.db import add_user, get_file_by_unique_id, get_user, get_owner_db_channel
 from utils.helpers import get_main_menu, decode_link, encode_link
 from features.shortener import get_shortlink
+from features.fsub import is_member, get_invite_link
 
 logger = logging.getLogger(__name__)
 
@@ -62,8 +63,8 @@ async def start_command(client, message):
         )
         await message.reply_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Let's Go 🚀", callback_data=f"go_back_{user_id}")]]))
 
-async def handle_file_request(client, message, user_id, payload):
-    """Contains the logic for FSub check and showing the shortener link."""
+async def handle_file_request(client, message, user_id, payload, recheck=False):
+    """Contains the logic for FSub check and showing the shortener link. `recheck` bypasses the membership cache."""
     file_unique_id = payload.split("_", 1)[1]
     file_data = await get_file_by_unique_id(file_unique_id)
     if not file_data: return await message.reply_text("File not found or link has expired.")
@@ -72,17 +73,15 @@ async def handle_file_request(client, message, user_id, payload):
     owner_settings = await get_user(owner_id)
     fsub_channel = owner_settings.get('fsub_channel')
 
-    if fsub_channel:
-        try:
-            await client.get_chat_member(chat_id=fsub_channel, user_id=user_id)
-        except UserNotParticipant:
-            try: invite_link = await client.export_chat_invite_link(fsub_channel)
-            except: invite_link = None
-            buttons = [[InlineKeyboardButton("📢 Join Channel", url=invite_link)], [InlineKeyboardButton("🔄 Retry", callback_data=f"retry_{payload}")]]
-            return await message.reply_text("You must join the channel to continue.", reply_markup=InlineKeyboardMarkup(buttons))
+    if fsub_channel and not await is_member(client, fsub_channel, user_id, recheck):
+        invite_link = await get_invite_link(client, fsub_channel)
+        buttons = [[InlineKeyboardButton("🔄 Retry", callback_data=f"retry_{payload}")]]
+        if invite_link:
+            buttons.insert(0, [InlineKeyboardButton("📢 Join Channel", url=invite_link)])
+        return await message.reply_text("You must join the channel to continue.", reply_markup=InlineKeyboardMarkup(buttons))
     
     final_delivery_link = f"https://t.me/{client.me.username}?start=finalget_{file_unique_id}"
-    shortened_link = await get_shortlink(final_delivery_link, owner_id)
+    shortened_link = await get_shortlink(client.http_session, final_delivery_link, owner_id, owner_settings)
     
     buttons = [[InlineKeyboardButton("➡️ Click Here to Get Your File ⬅️", url=shortened_link)]]
     if owner_settings.get("how_to_download_link"):
@@ -102,7 +101,7 @@ async def retry_handler(client, query):
     await query.message.delete()
     # Create a mock message object to pass to the handler
     query.message.command = ["start", payload]
-    await handle_file_request(client, query.message, user_id, payload)
+    await handle_file_request(client, query.message, user_id, payload, recheck=True)
 
 @Client.on_callback_query(filters.regex(r"go_back_"))
 async def go_back_callback(client, query):
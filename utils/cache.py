@@ -0,0 +1,62 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    A small in-process LRU cache whose entries expire after a TTL.
+    `get` returns `default` (MISSING unless given) for absent or expired keys,
+    so a cached None can be told apart from a miss.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        entry = self.data.get(key)
+        if entry is None or entry[1] < time.time():
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        self.data[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self.data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self.data.clear()
+
+    def entries(self):
+        """Unexpired (key, value, expires_at) entries, least recently used first. Used for cache snapshots."""
+        now = time.time()
+        return [(key, value, expires_at) for key, (value, expires_at) in self.data.items() if expires_at >= now]
+
+    def restore(self, entries):
+        """Adds entries from entries(), keeping their expiry. Expired entries and keys already cached are skipped."""
+        now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at > now and key not in self.data:
+                self.set(key, value, ttl=expires_at - now)
+
+    def __contains__(self, key):
+        entry = self.data.get(key)
+        return entry is not None and entry[1] >= time.time()
+
+    def __len__(self):
+        return len(self.data)
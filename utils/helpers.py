@@ -1,30 +1,17 @@
 import re
 import base64
 import logging
+import unicodedata
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database.db import get_user
 from features.poster import get_poster
 from features.shortener import get_shortlink
+from utils.parser import get_batch_key, clean_filename, parse_filename, marker_token, normalize_markers
+from utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
-# --- NEW LOCATION for get_batch_key ---
-def get_batch_key(filename: str):
-    """
-    This function creates a common name for related files to be batched together.
-    """
-    name = re.sub(r'\.\w+$', '', filename)
-    name = re.sub(r'[\._]', ' ', name)
-    delimiters = [
-        r'S\d{1,2}', r'Season\s?\d{1,2}', r'Part\s?\d{1,2}', r'E\d{1,3}', r'EP\d{1,3}',
-        r'\b(19|20)\d{2}\b', r'\b(4k|2160p|1080p|720p|480p)\b', r'\[.*?\]'
-    ]
-    match = re.search('|'.join(delimiters), name, re.I)
-    base_name = name[:match.start()].strip() if match else name.strip()
-    return re.sub(r'\s+', ' ', base_name).lower()
-
-
 async def get_main_menu(user_id):
     user_settings = await get_user(user_id)
     if not user_settings: return InlineKeyboardMarkup([])
@@ -48,13 +35,23 @@ async def get_main_menu(user_id):
         [
             InlineKeyboardButton(fsub_text, callback_data="set_fsub"),
             InlineKeyboardButton("❓ How to Download", callback_data="set_download")
-        ]
+        ],
+        [InlineKeyboardButton("⏱️ Batch Window", callback_data="batch_menu")]
     ]
     if user_id == Config.ADMIN_ID:
         buttons.append([InlineKeyboardButton("🔑 Set Owner DB", callback_data="set_owner_db")])
         buttons.append([InlineKeyboardButton("⚠️ Reset Files DB", callback_data="reset_db_prompt")])
     return InlineKeyboardMarkup(buttons)
 
+def get_batch_settings(user):
+    """Returns the owner's (idle window, max wait, max size) for batching, falling back to the Config defaults."""
+    user = user or {}
+    return (
+        user.get('batch_idle_window') or Config.BATCH_IDLE_WINDOW,
+        user.get('batch_max_wait') or Config.BATCH_MAX_WAIT,
+        user.get('batch_max_size') or Config.BATCH_MAX_SIZE
+    )
+
 def go_back_button(user_id):
     return InlineKeyboardMarkup([[InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")]])
 
@@ -68,22 +65,46 @@ def format_bytes(size):
 async def get_file_raw_link(message):
     return f"https://t.me/c/{str(message.chat.id).replace('-100', '')}/{message.id}"
 
-def clean_filename(name: str):
-    if not name: return "Untitled", None
-    name = re.sub(r'\[@.*?\]', '', name)
-    cleaned_name = re.sub(r'\.\w+$', '', name)
-    cleaned_name = re.sub(r'[\._]', ' ', cleaned_name)
-    year_match = re.search(r'\b(19|20)\d{2}\b', cleaned_name)
-    year = year_match.group(0) if year_match else None
-    if year: cleaned_name = cleaned_name.split(year)[0]
-    cleaned_name = re.sub(r'\[.*?\]|\(.*?\)|\{.*?\}', '', cleaned_name)
-    tags_to_remove = ['1080p', '720p', '480p', '2160p', '4k', 'HD', 'FHD', 'UHD', 'BluRay', 'WEBRip', 'WEB-DL', 'HDRip', 'x264', 'x265', 'HEVC', 'AAC', 'Dual Audio', 'Hindi', 'English', 'Esubs', r'S\d+E\d+', r'S\d+', r'Season\s?\d+', r'Part\s?\d+', r'E\d+', r'EP\d+']
-    for tag in tags_to_remove:
-        cleaned_name = re.sub(r'\b' + tag + r'\b', '', cleaned_name, flags=re.I)
-    final_title = re.sub(r'\s+', ' ', cleaned_name).strip()
-    if not final_title:
-        final_title = re.sub(r'\.\w+$', '', name).replace(".", " ")
-    return (f"{final_title} {year}".strip() if year else final_title), year
+def search_words(text: str):
+    """
+    The words of a filename or query as search tokens: casefolded, NFC-normalized
+    runs of letters, digits and combining marks, in any script. Marks are kept so
+    Devanagari vowel signs or a decomposed 'é' stay inside their word.
+    """
+    text = unicodedata.normalize('NFC', text.casefold())
+    return ''.join(
+        char if char.isalnum() or unicodedata.category(char)[0] == 'M' else ' ' for char in text
+    ).split()
+
+def get_search_tokens(text: str):
+    """
+    Splits a filename (or a search query) into the search_words stored in
+    'search_tokens'. The season/episode markers found by the parser are added
+    normalized, so 'S1E2', 'S01E02' and 'S01 E02' all index as 's01e02',
+    's01' and 'e02'.
+    """
+    if not text: return []
+    name = re.sub(r'\[@.*?\]', '', text)
+    name = re.sub(r'\.(mkv|mp4|avi|webm|mov|m4v|mp3|m4a|flac|zip|rar|pdf)$', '', name, flags=re.I)
+    tokens = set(search_words(name))
+    parsed = parse_filename(text)
+    tokens.update(marker_token(season=season) for season in parsed.seasons)
+    tokens.update(marker_token(episode=episode) for episode in parsed.episodes)
+    if len(parsed.seasons) == 1:
+        tokens.update(marker_token(parsed.season, episode) for episode in parsed.episodes)
+    return sorted(tokens)
+
+def get_query_tokens(query: str):
+    """
+    Splits a search query into (exact_tokens, prefix_token). Season/episode
+    markers are normalized like get_search_tokens does; the last plain word is
+    returned as a prefix so partial words still match.
+    """
+    words = search_words(normalize_markers(query))
+    if not words: return [], None
+    if re.fullmatch(r's\d{2,}(e\d{2,})?|e\d{2,}', words[-1]):
+        return sorted(set(words)), None
+    return sorted(set(words[:-1])), words[-1]
 
 def encode_link(text: str) -> str:
     return base64.urlsafe_b64encode(text.encode()).decode().strip("=")
@@ -113,7 +134,10 @@ async def create_post(client, user_id, messages):
         links += f"📁 `{link_label}`\n\n[🔗 Click Here]({permanent_web_link})\n\n"
     custom_caption = f"\n{user.get('custom_caption', '')}" if user.get('custom_caption') else ""
     final_caption = f"{caption_header}\n\n{links}{custom_caption}"
-    post_poster = await get_poster(title, year) if user.get('show_poster', True) else None
+    post_poster = None
+    if user.get('show_poster', True):
+        with span('get_poster'):
+            post_poster = await get_poster(client.http_session, title, year)
     footer_buttons_data = user.get('footer_buttons', [])
     footer_keyboard = None
     if footer_buttons_data:
@@ -0,0 +1,21 @@
+import aiohttp
+from config import Config
+
+
+def create_http_session():
+    """
+    Builds the single aiohttp session the bot shares for IMDb and shortener calls.
+    The bot creates it in start() and closes it in stop().
+    """
+    connector = aiohttp.TCPConnector(
+        limit=Config.HTTP_POOL_SIZE,
+        limit_per_host=Config.HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=Config.HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=Config.HTTP_KEEPALIVE_TIMEOUT
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=Config.HTTP_TOTAL_TIMEOUT,
+        connect=Config.HTTP_CONNECT_TIMEOUT,
+        sock_read=Config.HTTP_READ_TIMEOUT
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
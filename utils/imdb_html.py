@@ -0,0 +1,131 @@
+import asyncio
+import html
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Extraction of the two things features/poster.py needs from IMDb pages: the first
+# search result link and the hero poster image. The targeted scans below only look
+# at the tags involved instead of building a tree of the whole page; BeautifulSoup
+# is kept as the fallback for markup they do not understand.
+
+RESULT_LINK_CLASS = 'ipc-metadata-list-summary-item__t'
+RESULT_LINK_TAG = re.compile(r'<a\b[^>]*' + re.escape(RESULT_LINK_CLASS) + r'[^>]*>', re.I)
+POSTER_DIV_TAG = re.compile(r'<div\b[^>]*\bdata-testid\s*=\s*["\']hero-media__poster["\'][^>]*>', re.I)
+# Inside the poster div: nested div opens and closes (to find where it ends) and img tags
+POSTER_DIV_CONTENT = re.compile(r'<div\b|</div\s*>|<img\b[^>]*>', re.I)
+ATTRIBUTE = re.compile(r'([^\s=/>]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+
+
+def tag_attributes(tag: str):
+    """The attributes of one start tag, e.g. '<a class="x" href="/y">', with entities decoded."""
+    attributes = {}
+    for match in ATTRIBUTE.finditer(tag):
+        name = match.group(1).lower()
+        if name not in attributes:
+            value = next(group for group in match.groups()[1:] if group is not None)
+            attributes[name] = html.unescape(value)
+    return attributes
+
+
+def has_class(attributes, name):
+    return name in attributes.get('class', '').split()
+
+
+def extract_result_href(page: str):
+    """The href of the first IMDb search result, like select_one('a.ipc-metadata-list-summary-item__t')."""
+    for match in RESULT_LINK_TAG.finditer(page):
+        attributes = tag_attributes(match.group(0))
+        if has_class(attributes, RESULT_LINK_CLASS):
+            return attributes.get('href') or None
+    if RESULT_LINK_CLASS in page:
+        # The class is there but not in a tag the scan recognised; let a full parse decide
+        tag = soup(page).select_one(f"a.{RESULT_LINK_CLASS}")
+        return tag.get('href') if tag else None
+    return None
+
+
+def extract_poster_src(page: str):
+    """The src of the title page's main poster, like select_one('div[data-testid="hero-media__poster"] img.ipc-image')."""
+    for div in POSTER_DIV_TAG.finditer(page):
+        depth = 1
+        for match in POSTER_DIV_CONTENT.finditer(page, div.end()):
+            token = match.group(0)
+            if token[1] == '/':
+                depth -= 1
+                if depth == 0:
+                    break
+            elif token[1:4].lower() == 'div':
+                depth += 1
+            else:
+                attributes = tag_attributes(token)
+                if has_class(attributes, 'ipc-image') and attributes.get('src'):
+                    return attributes['src']
+    if 'hero-media__poster' in page:
+        tag = soup(page).select_one('div[data-testid="hero-media__poster"] img.ipc-image')
+        return tag.get('src') if tag else None
+    return None
+
+
+def soup(page: str):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(page, 'html.parser')
+
+
+# --- Process pool ---
+# Even the targeted scans are CPU work on pages of several hundred KB, so they run in
+# IMDB_PARSE_WORKERS worker processes and the event loop only waits for the result.
+
+pool = None
+# Pages handed to the pool and not yet parsed, so a burst of lookups cannot pile up pages in memory
+pool_slots = None
+
+
+def start_pool():
+    """
+    Starts the worker processes. Called first thing in Bot.start(), so the
+    workers are forked before Motor and aiohttp start their threads.
+    """
+    global pool, pool_slots
+    if pool is not None or Config.IMDB_PARSE_WORKERS <= 0:
+        return
+    pool = ProcessPoolExecutor(Config.IMDB_PARSE_WORKERS, mp_context=multiprocessing.get_context('fork'))
+    pool_slots = asyncio.Semaphore(Config.IMDB_PARSE_WORKERS * 2)
+    # With the fork start method every worker is created on the first submit
+    pool.submit(int).result()
+
+
+async def extract(function, page: str):
+    """
+    Runs one of the extract_* functions on a page in the pool. Without a pool
+    (IMDB_PARSE_WORKERS is 0, start_pool() was not called, or the pool broke)
+    it runs inline: forking workers now, with Motor and aiohttp threads
+    running, could deadlock them.
+    """
+    global pool
+    current = pool
+    if current is None:
+        return function(page)
+    async with pool_slots:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(current, function, page)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory). Concurrent lookups all see the
+            # same broken pool; only the first one retires it.
+            if pool is current:
+                logger.warning("IMDb parser pool broke; parsing inline until the next restart.")
+                pool = None
+                current.shutdown(wait=False)
+            return function(page)
+
+
+def shutdown_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = None
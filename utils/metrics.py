@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+
+# Seconds; fine enough for Mongo calls, wide enough for IMDb scrapes and FloodWait-paced copies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Every metric created in the process, in creation order; rendered by render_metrics()
+REGISTRY = []
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """Base of the counters, gauges and histograms below. Every metric registers itself in REGISTRY."""
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.label_names, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {value:g}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, self._format_labels(key), value
+
+
+class Gauge(Metric):
+    """A value read at scrape time from `callback`, which returns a number or {label tuple: number}."""
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def samples(self):
+        if self.callback is None:
+            return
+        value = self.callback()
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield self.name, self._format_labels(tuple(str(part) for part in key)), item
+        else:
+            yield self.name, '', value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[len(self.buckets)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the `with` block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, series in self.series.items():
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", self._format_labels(key, ('le', f"{bound:g}")), count
+            yield f"{self.name}_bucket", self._format_labels(key, ('le', '+Inf')), series[len(self.buckets)]
+            yield f"{self.name}_sum", self._format_labels(key), series[-1]
+            yield f"{self.name}_count", self._format_labels(key), series[len(self.buckets)]
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorates a coroutine function so every call is observed in `histogram`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_module(namespace: dict, histogram: Histogram, label: str, exclude=()):
+    """Wraps every coroutine function defined in a module's namespace with `timed`, labelled by function name."""
+    module_name = namespace['__name__']
+    for name, value in list(namespace.items()):
+        if inspect.iscoroutinefunction(value) and value.__module__ == module_name and name not in exclude:
+            namespace[name] = timed(histogram, **{label: name})(value)
+
+
+def render_metrics():
+    """The whole registry in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- Metrics shared across modules ---
+FLOODWAIT_SECONDS = Counter("floodwait_seconds_total", "Seconds of FloodWait received from Telegram.", ("operation",))
+FLOODWAITS = Counter("floodwaits_total", "FloodWait errors received from Telegram.", ("operation",))
+MONGO_CALL_SECONDS = Histogram("mongo_call_seconds", "Latency of the MongoDB calls made by database/db.py and the write buffer.", ("function",))
+EXTERNAL_CALL_SECONDS = Histogram("external_call_seconds", "Latency of calls to IMDb and URL shorteners.", ("service",))
+EXTERNAL_CALL_ERRORS = Counter("external_call_errors_total", "Failed calls to IMDb and URL shorteners.", ("service",))
+LOOP_LAG_SECONDS = Histogram("event_loop_lag_seconds", "How late the event loop woke up from a timed sleep, i.e. how long it was blocked.",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+def record_floodwait(operation: str, seconds: float):
+    FLOODWAITS.inc(operation=operation)
+    FLOODWAIT_SECONDS.inc(seconds, operation=operation)
+
+
+async def monitor_loop_lag(interval: float):
+    """Sleeps `interval` seconds in a loop and observes how late each wake-up was in LOOP_LAG_SECONDS. Runs until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - started - interval))
@@ -0,0 +1,147 @@
+import re
+from functools import lru_cache
+
+# Bump when the parsing rules change: file records saved under an older version
+# get their derived fields recomputed by database.backfill
+PARSER_VERSION = 3
+
+# All patterns are compiled once at import. They mirror the old get_batch_key /
+# clean_filename rules exactly, so titles and batch keys do not change.
+EXTENSION_RE = re.compile(r'\.\w+$')
+SEPARATOR_RE = re.compile(r'[\._]')
+CHANNEL_TAG_RE = re.compile(r'\[@.*?\]')
+BRACKETS_RE = re.compile(r'\[.*?\]|\(.*?\)|\{.*?\}')
+WHITESPACE_RE = re.compile(r'\s+')
+YEAR_RE = re.compile(r'\b(19|20)\d{2}\b')
+# Where the shared part of a release name ends; everything before it is the batch key
+BATCH_DELIMITER_RE = re.compile(
+    r'S\d{1,2}|Season\s?\d{1,2}|Part\s?\d{1,2}|E\d{1,3}|EP\d{1,3}'
+    r'|\b(19|20)\d{2}\b|\b(4k|2160p|1080p|720p|480p)\b|\[.*?\]',
+    re.I
+)
+# Release tags stripped from display titles, as one alternation instead of a pass per tag
+TAGS_RE = re.compile(
+    r'\b(?:1080p|720p|480p|2160p|4k|HD|FHD|UHD|BluRay|WEBRip|WEB-DL|HDRip|x264|x265|HEVC|AAC'
+    r'|Dual Audio|Hindi|English|Esubs|S\d+E\d+|S\d+|Season\s?\d+|Part\s?\d+|E\d+|EP\d+)\b',
+    re.I
+)
+# One scan picks up every structured field of a release name
+FIELDS_RE = re.compile(
+    r'\bS(?P<se_season>\d{1,2})\s?E(?P<se_episode>\d{1,3})(?=\b|E\d)'
+    r'|\bSeason\s?(?P<season>\d{1,2})\b'
+    r'|\bS(?P<s_season>\d{1,2})\b'
+    # Also the later episodes of a multi-episode name like S01E02E03
+    r'|(?:\b|(?<=\d))E(?:P|pisode\s?)?(?P<episode>\d{1,4})\b'
+    r'|\b(?P<quality>2160p|1080p|720p|480p|4k)\b'
+    r'|\b(?P<source>BluRay|BRRip|WEB-?DL|WEBRip|HDRip|DVDRip|HDTV|CAMRip|HDCAM|HDTS|PreDVD)\b',
+    re.I
+)
+
+
+class ParsedName:
+    """The fields parsed out of one release filename. `seasons` and `episodes` hold every marker, in order."""
+    __slots__ = ('title', 'year', 'season', 'episode', 'seasons', 'episodes', 'quality', 'source', 'batch_key')
+
+    def __init__(self, title, year, seasons, episodes, quality, source, batch_key):
+        self.title = title
+        self.year = year
+        self.season = seasons[0] if seasons else None
+        self.episode = episodes[0] if episodes else None
+        self.seasons = seasons
+        self.episodes = episodes
+        self.quality = quality
+        self.source = source
+        self.batch_key = batch_key
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ParsedName({fields})"
+
+
+def _batch_key(filename: str):
+    name = SEPARATOR_RE.sub(' ', EXTENSION_RE.sub('', filename))
+    match = BATCH_DELIMITER_RE.search(name)
+    base_name = name[:match.start()].strip() if match else name.strip()
+    return WHITESPACE_RE.sub(' ', base_name).lower()
+
+
+def _title(name: str):
+    name = CHANNEL_TAG_RE.sub('', name)
+    cleaned_name = SEPARATOR_RE.sub(' ', EXTENSION_RE.sub('', name))
+    year_match = YEAR_RE.search(cleaned_name)
+    year = year_match.group(0) if year_match else None
+    if year: cleaned_name = cleaned_name.split(year)[0]
+    cleaned_name = TAGS_RE.sub('', BRACKETS_RE.sub('', cleaned_name))
+    final_title = WHITESPACE_RE.sub(' ', cleaned_name).strip()
+    if not final_title:
+        final_title = EXTENSION_RE.sub('', name).replace(".", " ")
+    return final_title, year
+
+
+@lru_cache(maxsize=4096)
+def parse_filename(filename: str) -> ParsedName:
+    """Parses a release filename. Results are memoized, so treat them as read-only."""
+    if not filename:
+        return ParsedName("Untitled", None, (), (), None, None, "")
+    title, year = _title(filename)
+    seasons, episodes = [], []
+    quality = source = None
+    for match in FIELDS_RE.finditer(SEPARATOR_RE.sub(' ', filename)):
+        season, episode = _season_episode(match)
+        if season is not None and season not in seasons:
+            seasons.append(season)
+        if episode is not None and episode not in episodes:
+            episodes.append(episode)
+        groups = match.groupdict()
+        quality = quality or (groups['quality'] and groups['quality'].lower())
+        source = source or groups['source']
+    return ParsedName(title, year, tuple(seasons), tuple(episodes), quality, source, _batch_key(filename))
+
+
+def _season_episode(match):
+    """The (season, episode) numbers of one FIELDS_RE match; either is None when absent."""
+    groups = match.groupdict()
+    season = groups['se_season'] or groups['season'] or groups['s_season']
+    episode = groups['se_episode'] or groups['episode']
+    return (int(season) if season else None), (int(episode) if episode else None)
+
+
+def marker_token(season=None, episode=None):
+    """The search token of a season/episode marker: 's01e02', 's01' or 'e02'."""
+    return (f"s{season:02d}" if season is not None else "") + (f"e{episode:02d}" if episode is not None else "")
+
+
+def normalize_markers(text: str):
+    """The text with every season/episode marker ('S1E2', 'Season 1', 'Ep 2'...) replaced by its marker_token."""
+    def replace(match):
+        season, episode = _season_episode(match)
+        if season is None and episode is None:
+            return match.group(0)
+        return f" {marker_token(season, episode)} "
+    return FIELDS_RE.sub(replace, SEPARATOR_RE.sub(' ', text))
+
+
+def get_batch_key(filename: str):
+    """The common name related files are batched under."""
+    return parse_filename(filename).batch_key
+
+
+def clean_filename(name: str):
+    """Returns (display title, year); the title ends with the year when there is one."""
+    if not name: return "Untitled", None
+    parsed = parse_filename(name)
+    return (f"{parsed.title} {parsed.year}".strip() if parsed.year else parsed.title), parsed.year
+
+
+def get_file_metadata(filename: str):
+    """The parsed fields stored on a file record, so queries never have to re-parse names."""
+    parsed = parse_filename(filename or "")
+    return {
+        'batch_key': parsed.batch_key,
+        'title': parsed.title.lower(),
+        'year': int(parsed.year) if parsed.year else None,
+        'season': parsed.season,
+        'episode': parsed.episode,
+        'quality': parsed.quality,
+        'meta_version': PARSER_VERSION,
+    }
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+import zlib
+import bson
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_caches():
+    """The TTL caches saved in the snapshot, by name. Imported here to avoid import cycles."""
+    from database import db
+    from features import fsub, poster, shortener
+    return {
+        'users': db.user_cache,
+        'file_counts': db.file_count_cache,
+        'posters': poster.poster_cache,
+        'poster_refs': poster.poster_refs,
+        'shortlinks': shortener.shortlink_cache,
+        'fsub_members': fsub.member_cache,
+    }
+
+
+def build_snapshot():
+    """
+    The in-process caches as one BSON-encodable document. TTL cache entries keep
+    their expiry time; channel routes are stored as pairs and invite links with
+    the age of their last revocation check.
+    """
+    from database.db import channel_owners
+    from features.fsub import invite_links
+    now = time.monotonic()
+    return {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': time.time(),
+        'caches': {name: [list(entry) for entry in cache.entries()] for name, cache in snapshot_caches().items()},
+        'channel_owners': [[channel_id, owner] for channel_id, owner in channel_owners.items()],
+        'invite_links': [[channel_id, link, now - checked_at] for channel_id, (link, checked_at) in invite_links.items()],
+    }
+
+
+def apply_snapshot(snapshot):
+    """Fills the caches from a snapshot. Entries that expired while the bot was down are dropped."""
+    from database.db import channel_owners
+    from features.fsub import invite_links
+    caches = snapshot_caches()
+    restored = {}
+    for name, entries in snapshot.get('caches', {}).items():
+        cache = caches.get(name)
+        if cache is None:
+            continue
+        # BSON has no tuples; the composite keys (fsub, shortlinks) come back as lists
+        cache.restore((tuple(key) if isinstance(key, list) else key, value, expires_at) for key, value, expires_at in entries)
+        restored[name] = len(cache)
+    # Routes are replaced by load_channel_owners() on start; until then these route the first channel posts
+    for channel_id, owner in snapshot.get('channel_owners', []):
+        channel_owners.setdefault(channel_id, owner)
+    down_for = max(0.0, time.time() - snapshot['saved_at'])
+    now = time.monotonic()
+    for channel_id, link, age in snapshot.get('invite_links', []):
+        invite_links.setdefault(channel_id, (link, now - age - down_for))
+    restored['channel_owners'] = len(channel_owners)
+    restored['invite_links'] = len(invite_links)
+    return restored
+
+
+def write_file(path, data):
+    directory = os.path.dirname(path)
+    if directory: os.makedirs(directory, exist_ok=True)
+    # Write-then-rename, so a crash mid-write leaves the previous snapshot intact
+    temp_path = f"{path}.tmp"
+    # Owner-only: the user documents include shortener API keys
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, 'wb') as f:
+        os.fchmod(fd, 0o600)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return bson.decode(zlib.decompress(f.read()))
+
+
+async def save_snapshot(path=None):
+    """Writes the cache snapshot to CACHE_SNAPSHOT_FILE. Failures are logged, never raised."""
+    path = Config.CACHE_SNAPSHOT_FILE if path is None else path
+    if not path:
+        return
+    try:
+        # Built on the loop so the caches are not read while a handler changes them
+        data = zlib.compress(bson.encode(build_snapshot()))
+        await asyncio.to_thread(write_file, path, data)
+        logger.info(f"Saved cache snapshot ({len(data)} bytes) to {path}.")
+    except Exception as e:
+        logger.warning(f"Could not save cache snapshot to {path}: {e}")
+
+
+async def load_snapshot(path=None):
+    """Restores the caches from CACHE_SNAPSHOT_FILE, if there is one. Returns {cache: entries}."""
+    path = Config.CACHE_SNAPSHOT_FILE if path is None else path
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        snapshot = await asyncio.to_thread(read_file, path)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            logger.info(f"Ignoring cache snapshot {path} from another version.")
+            return {}
+        restored = apply_snapshot(snapshot)
+    except Exception as e:
+        logger.warning(f"Could not load cache snapshot from {path}: {e}")
+        return {}
+    logger.info(f"Warm start from cache snapshot: {restored}")
+    return restored
+
+
+async def snapshot_loop(interval):
+    """Saves the snapshot every `interval` seconds, so a crash loses at most that much warmth."""
+    while True:
+        await asyncio.sleep(interval)
+        await save_snapshot()
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import secrets
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# The trace that spans opened with span() are recorded on, e.g. the batch being posted
+current_trace = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """
+    The timeline of one unit of work, such as a file from channel post to
+    published post. Spans are (name, start, end, attrs) with wall-clock
+    times; finish() hands the trace to the exporter.
+    """
+    __slots__ = ('trace_id', 'name', 'attrs', 'started', 'spans', 'finished')
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = secrets.token_hex(8)
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.spans = []
+        self.finished = None
+
+    def add_span(self, name: str, start: float, end: float = None, **attrs):
+        self.spans.append((name, start, time.time() if end is None else end, attrs))
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Records the `with` block as a span, also when it raises."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, **attrs)
+
+    def finish(self, **attrs):
+        self.attrs.update(attrs)
+        self.finished = time.time()
+        exporter.export(self)
+
+    @property
+    def duration(self):
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'attrs': self.attrs,
+            'start': round(self.started, 3),
+            'duration': round(self.duration, 3),
+            'spans': [
+                {'name': name, 'offset': round(start - self.started, 3), 'duration': round(end - start, 3), **({'attrs': attrs} if attrs else {})}
+                for name, start, end, attrs in self.spans
+            ]
+        }
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """A span on the current trace; does nothing when no trace is active."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+    else:
+        with trace.span(name, **attrs):
+            yield
+
+
+def summarize(trace: Trace):
+    """One line per trace: total time and the spans that took it, longest first."""
+    spans = sorted(((end - start, name) for name, start, end, _ in trace.spans), reverse=True)
+    breakdown = ", ".join(f"{name} {seconds:.1f}s" for seconds, name in spans)
+    return f"{trace.duration:.1f}s [{breakdown}]"
+
+
+class TraceExporter:
+    """
+    Appends finished traces to a JSONL file and keeps the most recent ones in
+    memory for /traces. Traces over TRACE_SLOW_SECONDS, or with a span over
+    TRACE_SLOW_SPAN_SECONDS, are also logged as slow paths.
+    """
+
+    def __init__(self, path: str, keep: int):
+        self.path = path
+        self.recent = deque(maxlen=keep)
+        self.file = None
+
+    def export(self, trace: Trace):
+        self.recent.append(trace)
+        slowest_span = max((end - start for _, start, end, _ in trace.spans), default=0)
+        if trace.duration >= Config.TRACE_SLOW_SECONDS or slowest_span >= Config.TRACE_SLOW_SPAN_SECONDS:
+            logger.warning(f"Slow {trace.name} {trace.trace_id} {trace.attrs}: {summarize(trace)}")
+        if not self.path:
+            return
+        try:
+            if self.file is None:
+                directory = os.path.dirname(self.path)
+                if directory: os.makedirs(directory, exist_ok=True)
+                self.file = open(self.path, 'a', buffering=1, encoding='utf-8')
+            self.file.write(json.dumps(trace.to_dict(), default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write trace to {self.path}: {e}")
+
+    def slowest(self, count: int = 10, name: str = None):
+        traces = [trace for trace in self.recent if name is None or trace.name == name]
+        return sorted(traces, key=lambda trace: trace.duration, reverse=True)[:count]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+exporter = TraceExporter(Config.TRACE_FILE, Config.TRACE_RECENT)